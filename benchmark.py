@@ -0,0 +1,244 @@
+#Language: Python 3
+#Purpose: Reproducible benchmarks for the SG2 pipeline stages.
+#A seeded generator writes a synthetic corpus, then split_file, build_concordance,
+#load_or_build_concordance (a full build and a reopen of the saved index),
+#sort_key sorting, print_and_write_concordance and write_extra_lists are timed
+#on it. Results are saved as JSON so runs on different commits can be compared.
+#Runs offline with the standard library only.
+#Example:
+#  python benchmark.py --files 20 --words 50000 --output bench.json
+#  python benchmark.py --files 20 --words 50000 --compare bench.json
+
+
+import os
+import sys
+import json
+import time
+import random
+import string
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+import subprocess
+from itertools import accumulate
+
+import sg2
+
+
+# Synthetic corpus
+
+#Makes vocab_size distinct lowercase words; about hyphen_rate of them are
+#hyphenated compounds such as "well-known".
+def make_vocabulary(rng, vocab_size, hyphen_rate):
+    vocab = []
+    seen = set()
+    while len(vocab) < vocab_size:
+        word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 10)))
+        if rng.random() < hyphen_rate:
+            word += "-" + "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 8)))
+        if word not in seen:
+            seen.add(word)
+            vocab.append(word)
+    return vocab
+
+#Writes `files` text files of `words` words each into out_dir and returns their paths.
+#Words are drawn from a Zipf distribution (weight 1 / rank**zipf_s). With
+#probability line_end_hyphen_rate a word that ends a line is split across the
+#line break ("exam-" / "ple"), exercising the line-end rejoin rule.
+def generate_corpus(out_dir, files=10, words=20000, vocab_size=5000, zipf_s=1.1,
+                    hyphen_rate=0.05, line_end_hyphen_rate=0.02, words_per_line=12, seed=1):
+    rng = random.Random(seed)
+    vocab = make_vocabulary(rng, vocab_size, hyphen_rate)
+    cum_weights = list(accumulate(1.0 / (rank ** zipf_s) for rank in range(1, vocab_size + 1)))
+    paths = []
+    for n in range(1, files + 1):
+        drawn = rng.choices(vocab, cum_weights=cum_weights, k=words)
+        lines = []
+        for start in range(0, words, words_per_line):
+            line_words = drawn[start:start + words_per_line]
+            if start:
+                # capitalize line starts so case folding is exercised too
+                line_words[0] = line_words[0].capitalize()
+            line = " ".join(line_words)
+            last = line_words[-1]
+            if len(last) > 3 and "-" not in last and rng.random() < line_end_hyphen_rate:
+                cut = rng.randint(2, len(last) - 1)
+                line = line[:len(line) - len(last)] + last[:cut] + "-"
+                lines.append(line)
+                lines.append(last[cut:] + ",")
+                continue
+            lines.append(line + rng.choice([".", ",", "", ";"]))
+        path = os.path.join(out_dir, f"synthetic{n:04d}.txt")
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write("\n".join(lines) + "\n")
+        paths.append(path)
+    return paths
+
+
+# Stages
+
+#Each stage is a function of the shared state dict; it returns the number of
+#words it processed so throughput can be reported.
+def stage_split_file(state):
+    return sum(len(w) for path in state["files"] for w in sg2.split_file(path))
+
+def stage_build_concordance(state):
+    state["concordance"], _word_sets = sg2.build_concordance(state["files"], workers=state["workers"])
+    return state["total_words"]
+
+#The batch CLI path with no usable index: parse everything and save the index.
+def stage_load_or_build_concordance(state):
+    index_path = os.path.join(state["out_dir"], sg2.INDEX_FILE)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    sg2.load_or_build_concordance(state["files"], index_path, workers=state["workers"])
+    return state["total_words"]
+
+#The batch CLI path on a rerun: every file is unchanged, so the index saved
+#by the previous stage is reopened as it is.
+def stage_reopen_index(state):
+    index = sg2.load_or_build_concordance(state["files"], os.path.join(state["out_dir"], sg2.INDEX_FILE),
+                                          workers=state["workers"])
+    index.close()
+    return state["total_words"]
+
+def stage_sort_key(state):
+    words = list(state["concordance"].keys())
+    words.sort(key=sg2.sort_key)
+    return len(words)
+
+def stage_print_and_write_concordance(state):
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        sg2.print_and_write_concordance(state["concordance"], os.path.join(state["out_dir"], "CONCORDANCE.TXT"))
+    return state["total_words"]
+
+def stage_write_extra_lists(state):
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        sg2.write_extra_lists(state["concordance"], state["files"], os.path.join(state["out_dir"], "ExtraLists.txt"))
+    return len(state["concordance"])
+
+STAGES = [
+    ("split_file", stage_split_file),
+    ("build_concordance", stage_build_concordance),
+    ("load_or_build_concordance", stage_load_or_build_concordance),
+    ("reopen_index", stage_reopen_index),
+    ("sort_key", stage_sort_key),
+    ("print_and_write_concordance", stage_print_and_write_concordance),
+    ("write_extra_lists", stage_write_extra_lists),
+]
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+#Runs every stage `repeat` times and keeps the fastest wall time, then runs the
+#stages once more under tracemalloc to get each stage's peak memory (tracing
+#slows Python down, so it is kept out of the timed runs).
+def run_benchmark(files, out_dir, repeat=3, workers=None):
+    state = {"files": files, "out_dir": out_dir, "workers": workers}
+    input_bytes = sum(os.path.getsize(f) for f in files)
+    state["total_words"] = stage_split_file(state)
+
+    results = {}
+    for name, stage in STAGES:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            items = stage(state)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = {
+            "wall_s": round(best, 6),
+            "items": items,
+            "words_per_s": round(state["total_words"] / best, 1) if best else None,
+            "mb_per_s": round(input_bytes / 1e6 / best, 3) if best else None,
+        }
+
+    tracemalloc.start()
+    for name, stage in STAGES:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        stage(state)
+        results[name]["peak_mem_bytes"] = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return {"input_bytes": input_bytes, "total_words": state["total_words"], "stages": results}
+
+
+#Prints the wall time of each stage next to a previous result file.
+def print_comparison(current, previous):
+    print(f"\n{'Stage':<30} {'before s':>10} {'after s':>10} {'speedup':>8}")
+    print("-" * 61)
+    for name, _stage in STAGES:
+        after = current["stages"][name]["wall_s"]
+        before = previous.get("stages", {}).get(name, {}).get("wall_s")
+        if before is None:
+            print(f"{name:<30} {'-':>10} {after:>10.4f} {'-':>8}")
+        else:
+            print(f"{name:<30} {before:>10.4f} {after:>10.4f} {before / after if after else 0:>7.2f}x")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the SG2 stages on a seeded synthetic corpus")
+    parser.add_argument("--files", type=int, default=10, help="number of files (default 10)")
+    parser.add_argument("--words", type=int, default=20000, help="words per file (default 20000)")
+    parser.add_argument("--vocab", type=int, default=5000, help="vocabulary size (default 5000)")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf skew exponent (default 1.1)")
+    parser.add_argument("--hyphen-rate", type=float, default=0.05,
+                        help="fraction of the vocabulary that is hyphenated (default 0.05)")
+    parser.add_argument("--line-end-hyphen-rate", type=float, default=0.02,
+                        help="chance a line ends with a word split across the break (default 0.02)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed (default 1)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, best is kept (default 3)")
+    parser.add_argument("--workers", type=int, help="worker processes for build_concordance")
+    parser.add_argument("--output", metavar="FILE", help="write the results as JSON to FILE")
+    parser.add_argument("--compare", metavar="FILE", help="compare with a previous JSON result")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    params = {
+        "files": args.files, "words": args.words, "vocab": args.vocab, "zipf": args.zipf,
+        "hyphen_rate": args.hyphen_rate, "line_end_hyphen_rate": args.line_end_hyphen_rate,
+        "seed": args.seed, "repeat": args.repeat, "workers": args.workers,
+    }
+    with tempfile.TemporaryDirectory(prefix="sg2-bench-") as tmp:
+        corpus_dir = os.path.join(tmp, "corpus")
+        os.makedirs(corpus_dir)
+        files = generate_corpus(corpus_dir, files=args.files, words=args.words, vocab_size=args.vocab,
+                                zipf_s=args.zipf, hyphen_rate=args.hyphen_rate,
+                                line_end_hyphen_rate=args.line_end_hyphen_rate, seed=args.seed)
+        result = run_benchmark(files, tmp, repeat=args.repeat, workers=args.workers)
+
+    result["meta"] = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": params,
+    }
+
+    print(f"{result['total_words']} words, {result['input_bytes'] / 1e6:.2f} MB in {args.files} files")
+    print(f"{'Stage':<30} {'wall s':>10} {'words/s':>12} {'MB/s':>8} {'peak MB':>8}")
+    print("-" * 72)
+    for name, _stage in STAGES:
+        r = result["stages"][name]
+        print(f"{name:<30} {r['wall_s']:>10.4f} {r['words_per_s']:>12.0f} {r['mb_per_s']:>8.2f} "
+              f"{r['peak_mem_bytes'] / 1e6:>8.2f}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as fh:
+            print_comparison(result, json.load(fh))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
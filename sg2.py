@@ -10,14 +10,59 @@
 import re
 import os
 import sys
-from collections import defaultdict
+import argparse
+import csv
+import glob
+import mmap
+import struct
+import hashlib
+import heapq
+import tempfile
+import math
+import json
+import time
+import io
+import threading
+import gzip
+import bz2
+import asyncio
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, deque
 from collections import Counter
+from itertools import accumulate, groupby, islice, repeat
+from operator import itemgetter
+from collections.abc import Mapping
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+try:
+    import lzma  # optional in some Python builds
+except ImportError:
+    lzma = None
 
 # Helper / Core Functions
 
+# Compressed text files (.txt.gz, .txt.bz2, .txt.xz) are read through these
+# and decompressed as a stream, never written back to disk.
+COMPRESSED_SUFFIXES = {".gz": gzip.open, ".bz2": bz2.open}
+if lzma is not None:
+    COMPRESSED_SUFFIXES[".xz"] = lzma.open
+
+#Returns the open function for a compressed .txt file name, or None.
+def compressed_opener(fname):
+    root, ext = os.path.splitext(fname.lower())
+    if root.endswith(".txt"):
+        return COMPRESSED_SUFFIXES.get(ext)
+    return None
+
 def is_txt_filename(fname: str) -> bool:
-    #Return True if fname ends with .txt (case-insensitive).
-    return fname.lower().endswith('.txt')
+    #Return True if fname ends with .txt (case-insensitive), optionally
+    #followed by a compression suffix (.txt.gz, .txt.bz2, .txt.xz).
+    return fname.lower().endswith('.txt') or compressed_opener(fname) is not None
 
 def prompt_input(prompt: str) -> str:
     #Wrapper for input to make testing easier (and consistent prompts).
@@ -44,6 +89,147 @@ def prompt_yes_no(prompt: str) -> bool:
             return False
         print("Invalid response. Please answer 'Yes' or 'No' (y/n).")
 
+# Instrumentation
+# Stages (load, tokenize, index, search, concordance sort, render, write, ...)
+# are wrapped in `with profile_stage(name) as stage:`. Unless profiling has
+# been turned on with enable_profiling(), profile_stage hands back one shared
+# do-nothing object, so the cost of an instrumented stage is a global lookup.
+# Stages nest; each stage's time excludes the stages running inside it.
+# Work done in worker processes (build_concordance workers=N) is not recorded.
+
+_profiler = None
+
+class _NullStage:
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def add(self, n=1):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    __slots__ = ("profiler", "name", "items", "child_wall", "child_cpu", "wall0", "cpu0")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.items = 0
+        self.child_wall = 0.0
+        self.child_cpu = 0.0
+
+    def add(self, n=1):
+        #Adds n to the stage's item count (words, lines, entries, ...).
+        self.items += n
+
+    def __enter__(self):
+        self.profiler._stack.append(self)
+        self.wall0 = time.perf_counter()
+        self.cpu0 = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall0
+        cpu = time.process_time() - self.cpu0
+        stack = self.profiler._stack
+        stack.pop()
+        if stack:
+            stack[-1].child_wall += wall
+            stack[-1].child_cpu += cpu
+        self.profiler._record(self.name, wall - self.child_wall, cpu - self.child_cpu, self.items)
+        return False
+
+class Profiler:
+    """
+    Collects wall time, CPU time, call and item counts and the process peak
+    RSS for each named stage. Hooks are called as hook(name, wall_s, cpu_s, items)
+    every time a stage finishes. Stages may run on several threads (see
+    FileLoader); their times then overlap, so they can add up to more than
+    the total wall time.
+    """
+
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self.stages = {}
+        self._local = threading.local()  # each thread nests its own stages
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    @property
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def _record(self, name, wall, cpu, items):
+        with self._lock:
+            rec = self.stages.get(name)
+            if rec is None:
+                rec = self.stages[name] = {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "items": 0, "peak_rss_kb": 0}
+            rec["calls"] += 1
+            rec["wall_s"] += wall
+            rec["cpu_s"] += cpu
+            rec["items"] += items
+            rec["peak_rss_kb"] = peak_rss_kb()
+            for hook in self.hooks:
+                hook(name, wall, cpu, items)
+
+    def report(self):
+        return {
+            "total_wall_s": time.perf_counter() - self._start,
+            "peak_rss_kb": peak_rss_kb(),
+            "stages": self.stages,
+        }
+
+    def write_report(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+
+#Process high-water mark in KiB, or None where the resource module is missing.
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def enable_profiling(hooks=()):
+    global _profiler
+    _profiler = Profiler(hooks)
+    return _profiler
+
+def disable_profiling():
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+def profile_stage(name):
+    if _profiler is None:
+        return _NULL_STAGE
+    return _Stage(_profiler, name)
+
+#Times only the work done inside iterable (e.g. the tokenizer) under name,
+#leaving the time the caller spends on each item to the caller's stage.
+#count(item) gives the number of items to record for each one (default 1).
+def profile_iter(name, iterable, count=None):
+    if _profiler is None:
+        return iterable
+    return _profiled_iter(name, iter(iterable), count)
+
+def _profiled_iter(name, iterator, count):
+    while True:
+        with profile_stage(name) as stage:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            stage.add(count(item) if count else 1)
+        yield item
+
 # regex: letters with optional internal hyphens (one or more groups separated by hyphens)
 WORD_RE = re.compile(r"[A-Za-z]+(?:-[A-Za-z]+)*")
 
@@ -51,50 +237,6 @@ def normalize_word(word: str) -> str:
     #Normalize a word for case-insensitive comparison (lowercase).
     return word.lower()
 
-def parse_text_handling_line_hyphens(lines):
-    """
-    Given list of lines from a file, return a single string where lines that end with a hyphen
-    WITHOUT a space before the hyphen are joined to the next line (the hyphen removed).
-    Otherwise, newlines replaced with spaces.
-    """
-    processed_parts = []
-    i = 0
-    while i < len(lines):
-        line = lines[i].rstrip('\n')
-        # Check if the line ends with '-' AND the character before hyphen is not a space,
-        # i.e., "...hyphenated-" but NOT " ... -"
-        if line.endswith('-') and (len(line) >= 2 and line[-2] != ' '):
-            # Remove the trailing hyphen
-            left = line[:-1]
-            # If there is a next line, consume and join starting from its leading characters
-            if i + 1 < len(lines):
-                next_line = lines[i+1].lstrip()  # remove leading whitespace from next line
-                joined = left + next_line
-                # Now, treat joined as a single new "line" and skip the next line (we consumed it)
-                processed_parts.append(joined)
-                i += 2
-                continue
-            else:
-                # last line ends with hyphen; remove hyphen and continue
-                processed_parts.append(left)
-                i += 1
-                continue
-        else:
-            # normal line break; replace with a space to not join words across lines
-            processed_parts.append(line)
-            i += 1
-    # join with spaces to preserve separation between processed parts
-    return ' '.join(processed_parts)
-
-def extract_words_from_text(text: str):
-    """
-    Extract words according to LEGAL word definition:
-    - series of alphabetic characters
-    - internal hyphen(s) allowed between alphabetic groups (e.g., 'first-base', 'well-known')
-    Returns a list of words in the order found.
-    """
-    return WORD_RE.findall(text)
-
 # Printing / Formatting
 
 def print_file_summary(file_order, word_data):
@@ -105,15 +247,19 @@ def print_file_summary(file_order, word_data):
     - file_order: list of filenames in the order they were entered
     - word_data: dictionary where:
         key = filename (string)
-        value = list of all words extracted from that file
+        value = Counter of lowercased word -> occurrences in that file
     """
     # Compute values
     rows = []
     for fname in file_order:
-        words = word_data[fname] # Get the list of words for this file
-        total = len(words) # Count all words (including duplicates)
-        distinct = len(set(normalize_word(w) for w in words)) # Count unique words (case-insensitive)
+        counts = word_data[fname] # Get the word counts for this file
+        total = sum(counts.values()) # Count all words (including duplicates)
+        distinct = len(counts) # Count unique words (already lowercased)
         rows.append((fname, total, distinct))
+    print_summary_rows(rows)
+
+def print_summary_rows(rows):
+    #rows: list of (filename, total, distinct); distinct may be a string such as "~1234"
     # Determine column widths
     max_fname_len = max((len(r[0]) for r in rows), default=8)
     max_total_len = max((len(str(r[1])) for r in rows), default=5)
@@ -167,8 +313,163 @@ def print_search_history_summary(search_history, file_order):
             row_parts.append(f"{str(counts.get(f,0)):>{fname_widths[f]}}")
         print("  ".join(row_parts))
     print()
+
+def count_word(word, file_order, word_data):
+    #Returns {filename: count} for one legal word using the per-file count index
+    with profile_stage("search") as stage:
+        lw_norm = normalize_word(word)
+        stage.add()
+        return {fname: word_data[fname].get(lw_norm, 0) for fname in file_order}
+
+def read_query_words(source):
+    """
+    Read search words for batch mode from a file, or from stdin when source is '-'.
+    Words are separated by whitespace; any number may appear on a line.
+    """
+    if source == "-":
+        text = sys.stdin.read()
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            text = f.read()
+    return text.split()
+
+def batch_search(queries, file_order, word_data, index=None):
+    """
+    Look up every word in queries and return a search history list in the
+    same shape the interactive loop builds: (legal_word, {filename: count}).
+    Illegal words are reported and skipped.
+    With index (a ConcordanceIndex over file_order) the counts are read from
+    the index and word_data is not used.
+    """
+    search_history = []
+    terms = None # term dictionary, built on the first wildcard pattern
+    for candidate in queries:
+        if is_wildcard_query(candidate):
+            if terms is None:
+                terms = TermDictionary(index) if index is not None else TermDictionary.from_word_data(word_data)
+            if index is not None:
+                results = Counter({fname: 0 for fname in file_order})
+                with profile_stage("search") as stage:
+                    for match in terms.expand(candidate):
+                        results.update(search_index(index, match))
+                        stage.add()
+                search_history.append((candidate, dict(results)))
+            else:
+                search_history.append((candidate, count_pattern(candidate, terms, file_order, word_data)[0]))
+            continue
+        if not WORD_RE.fullmatch(candidate):
+            print(f"Skipping invalid word '{candidate}'.")
+            continue
+        if index is not None:
+            with profile_stage("search") as stage:
+                search_history.append((candidate, search_index(index, normalize_word(candidate))))
+                stage.add()
+        else:
+            search_history.append((candidate, count_word(candidate, file_order, word_data)))
+    return search_history
     
 
+# Wildcard search
+# Patterns use * (any run of characters, also none) and ? (one character),
+# e.g. well-*, *ing, c?t, *-base*. Matches are case-insensitive.
+# The vocabulary is kept sorted by collation_key, so a prefix pattern is one
+# bisect range; a suffix pattern is a range in the same list built from the
+# reversed keys. Other patterns are narrowed with a trigram index (each word
+# padded as ^word$) and the survivors are checked with a regular expression.
+
+WILDCARD_RE = re.compile(r"[A-Za-z?*]+(?:-[A-Za-z?*]+)*-?|[*?][A-Za-z?*-]*")
+_NGRAM = 3
+
+#True if text is a legal wildcard pattern (legal word characters plus at least one * or ?)
+def is_wildcard_query(text):
+    return ("*" in text or "?" in text) and WILDCARD_RE.fullmatch(text) is not None
+
+def _ngrams(text):
+    return {text[i:i + _NGRAM] for i in range(len(text) - _NGRAM + 1)}
+
+#Bisect range [lo, hi) of the sorted keys that start with prefix.
+def _prefix_range(keys, prefix):
+    return bisect_left(keys, prefix), bisect_left(keys, prefix + "\uffff")
+
+class TermDictionary:
+
+    def __init__(self, words):
+        self.words = sorted({normalize_word(w) for w in words}, key=collation_key)
+        self._keys = [collation_key(w) for w in self.words]
+        reversed_ids = sorted(range(len(self.words)), key=lambda i: self._keys[i][::-1])
+        self._reversed_ids = array("I", reversed_ids)
+        self._reversed_keys = [self._keys[i][::-1] for i in reversed_ids]
+        grams = defaultdict(lambda: array("I"))
+        for i, word in enumerate(self.words):
+            for gram in _ngrams(f"^{word}$"):
+                grams[gram].append(i)
+        self._grams = dict(grams)
+
+    @classmethod
+    def from_word_data(cls, word_data):
+        vocabulary = set()
+        for counts in word_data.values():
+            vocabulary.update(counts)
+        return cls(vocabulary)
+
+    def prefix(self, prefix):
+        lo, hi = _prefix_range(self._keys, collation_key(prefix))
+        return self.words[lo:hi]
+
+    def suffix(self, suffix):
+        lo, hi = _prefix_range(self._reversed_keys, collation_key(suffix)[::-1])
+        return sorted((self.words[i] for i in self._reversed_ids[lo:hi]), key=collation_key)
+
+    #All vocabulary words matching pattern, in concordance order.
+    def expand(self, pattern):
+        pattern = normalize_word(pattern)
+        literal = pattern.strip("*")
+        if "?" not in pattern and "*" not in literal:
+            if pattern.endswith("*") and not pattern.startswith("*"):
+                return self.prefix(literal)
+            if pattern.startswith("*") and not pattern.endswith("*"):
+                return self.suffix(literal)
+        matcher = re.compile("".join(".*" if ch == "*" else "." if ch == "?" else re.escape(ch)
+                                     for ch in pattern))
+        # n-grams every match must contain: those inside the literal runs,
+        # with ^ and $ added where the pattern is anchored
+        anchored = ("" if pattern.startswith(("*", "?")) else "^") + pattern + \
+                   ("" if pattern.endswith(("*", "?")) else "$")
+        required = set()
+        for run in re.split(r"[*?]", anchored):
+            required |= _ngrams(run)
+        if required:
+            lists = sorted((self._grams.get(g, ()) for g in required), key=len)
+            candidates = set(lists[0])
+            for ids in lists[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(ids)
+            candidates = (self.words[i] for i in sorted(candidates))
+        else:
+            head = re.split(r"[*?]", pattern, maxsplit=1)[0]
+            candidates = self.prefix(head) if head else self.words
+        return [w for w in candidates if matcher.fullmatch(w)]
+
+#Expands pattern and adds up the counts of every matching word per file.
+#Returns ({filename: count}, [matched words]).
+def count_pattern(pattern, terms, file_order, word_data):
+    with profile_stage("search") as stage:
+        matches = terms.expand(pattern)
+        stage.add(len(matches))
+        results = {fname: sum(word_data[fname].get(w, 0) for w in matches) for fname in file_order}
+    return results, matches
+
+def print_pattern_matches(matches, limit=20):
+    if not matches:
+        print("  no matching words.")
+    else:
+        shown = ", ".join(matches[:limit])
+        more = f" and {len(matches) - limit} more" if len(matches) > limit else ""
+        print(f"  {len(matches)} matching word(s): {shown}{more}.")
+    print()
+
+
 #This will return the first word on line for split words
 def first_word(line: str):
    word = ""
@@ -183,16 +484,19 @@ def first_word(line: str):
 
 #This will take the test files and make inti lowercase words per line.
 #This also combines the hyphenated word into a singular word
-#Howevre it keeps internal hiphens and returns a list
+#Howevre it keeps internal hiphens and yields (line_number, words) per line
 #Resource used for this: https://stackoverflow.com/questions/54404158/regex-joining-words-splitted-by-whitespace-and-hyphen
-def split_file(file_name):
-    with open(file_name, "r", encoding="utf-8") as file:
-        lines = file.read().splitlines()
-
-    words_per_line = []
+#lines can be any iterable of lines (no line breaks); only one line of
+#lookahead is kept, so a file can be streamed through it line by line.
+def split_lines(lines):
     drop_first_next = False 
+    lines = iter(lines)
+    line_text = next(lines, None)
+    line_number = 0
 
-    for i, line_text in enumerate(lines):
+    while line_text is not None:
+        next_text = next(lines, None)
+        line_number += 1
 
         words_here = [w.lower() for w in WORD_RE.findall(line_text)]
 
@@ -200,8 +504,8 @@ def split_file(file_name):
             words_here = words_here[1:]
             drop_first_next = False
 
-        if line_text.rstrip().endswith("-") and i + 1 < len(lines):
-            next_first = first_word(lines[i + 1])
+        if line_text.rstrip().endswith("-") and next_text is not None:
+            next_first = first_word(next_text)
             if next_first:
                 m = re.search(r"([A-Za-z]+)-\s*$", line_text)
                 if m:
@@ -213,106 +517,1567 @@ def split_file(file_name):
                         words_here.append(merged)
                     drop_first_next = True
 
-        words_per_line.append(words_here)
+        yield line_number, words_here
+        line_text = next_text
 
-    return words_per_line
+#Characters read per chunk when streaming a text file
+TEXT_CHUNK_SIZE = 1 << 20
+
+#Yields the lines of an open text file exactly like file.read().splitlines(),
+#but reads chunk_size characters at a time and only holds back the last,
+#possibly unfinished, line. The file must use universal newlines (the default
+#for open(..., "r")), so every line break is a single character.
+def iter_text_lines(file, chunk_size=TEXT_CHUNK_SIZE):
+    pending = ""
+    while True:
+        with profile_stage("load") as stage:
+            chunk = file.read(chunk_size)
+            stage.add(len(chunk))
+        if not chunk:
+            break
+        lines = (pending + chunk).splitlines(keepends=True)
+        pending = lines.pop()
+        if pending.splitlines() != [pending]:
+            # the last line is complete, so it can go out now
+            lines.append(pending)
+            pending = ""
+        for line in lines:
+            yield line[:-1]
+    if pending:
+        yield pending
+
+# Fast path for plain ASCII text: the file is memory-mapped and handled a
+# block at a time. One bytes.translate call per block lowercases the letters
+# and blanks everything that cannot be part of a word, so the per-line work is
+# a str.split (WORD_RE only for lines that still contain a hyphen), and no
+# whole-file string or line list is ever built.
+# It follows split_lines exactly. Files with non-ASCII bytes, a lone '\r', or
+# the rarer characters str.splitlines/str.strip treat as line breaks or
+# whitespace (\v \f \x1c-\x1f) use the text path instead.
+ASCII_BLOCK_SIZE = 1 << 20
+_WORD_BYTES = b"abcdefghijklmnopqrstuvwxyz-\n"
+_ASCII_WORD_TABLE = bytes(c if c in _WORD_BYTES else c + 32 if 65 <= c <= 90 else 32 for c in range(256))
+_HYPHEN_END_BRE = re.compile(rb"-[ \t]*\r?\n")
+_FIRST_WORD_BRE = re.compile(rb"[A-Za-z-]+")
+_STEM_BRE = re.compile(rb"([A-Za-z]+)-\s*$")
+_ASCII_UNSAFE_BRE = re.compile(rb"[^\x00-\x0a\x0d-\x1b\x20-\x7f]")
+_LONE_CR_BRE = re.compile(rb"\r(?!\n)")
+
+#True if the line ending just before end (a '\n' or end of buf) ends with '-'.
+def _ends_with_hyphen(buf, end):
+    if end > 0 and buf[end - 1] == 13:  # '\r' of '\r\n'
+        end -= 1
+    while end > 0 and buf[end - 1] in (32, 9):
+        end -= 1
+    return end > 0 and buf[end - 1] == 45
+
+#Yields (start, end) of blocks of about block_size bytes. Blocks end after a
+#newline, and never right after a line ending in '-', so a line and the line
+#it may be joined with always land in the same block.
+def _ascii_blocks(buf, block_size):
+    size = len(buf)
+    start = 0
+    while start < size:
+        end = min(start + block_size, size)
+        if end < size:
+            nl = buf.find(b"\n", end - 1)
+            end = size if nl < 0 else nl + 1
+        while end < size and _ends_with_hyphen(buf, end - 1):
+            nl = buf.find(b"\n", end)
+            end = size if nl < 0 else nl + 1
+        yield start, end
+        start = end
+
+def _first_word_at(buf, start, end):
+    m = _FIRST_WORD_BRE.search(buf, start, end)
+    return m.group().lower().decode("ascii") if m else None
+
+def _stem_at(buf, start, end):
+    m = _STEM_BRE.search(buf, start, end)
+    return m.group(1).lower().decode("ascii") if m else None
+
+#Finds the lines of a block that end in a split word. Returns
+#{line index in block: (stem, first word of the next line)}.
+def _hyphen_joins(data):
+    joins = {}
+    line_index = 0
+    counted = 0
+    for m in _HYPHEN_END_BRE.finditer(data):
+        nl = m.end() - 1
+        line_index += data.count(b"\n", counted, nl)
+        counted = nl
+        if m.end() >= len(data):
+            continue  # last line of the file; nothing to join with
+        next_end = data.find(b"\n", m.end())
+        next_first = _first_word_at(data, m.end(), len(data) if next_end < 0 else next_end)
+        if next_first:
+            stem = _stem_at(data, data.rfind(b"\n", 0, m.start()) + 1, nl)
+            if stem:
+                joins[line_index] = (stem, next_first)
+    return joins
+
+#split_lines for an ASCII bytes buffer (bytes or mmap): yields (line_number, words)
+def split_ascii_buffer(buf, block_size=ASCII_BLOCK_SIZE):
+    line_number = 0
+    drop_first_next = False
+
+    for start, end in _ascii_blocks(buf, block_size):
+        data = buf[start:end]
+        lines = data.translate(_ASCII_WORD_TABLE).decode("ascii").split("\n")
+        if data.endswith(b"\n"):
+            lines.pop()
+        joins = _hyphen_joins(data)
+
+        for i, line in enumerate(lines):
+            # only letters, hyphens and spaces are left; a hyphen is part of
+            # a word only between two letters, which WORD_RE sorts out
+            words_here = WORD_RE.findall(line) if "-" in line else line.split()
+            line_number += 1
+
+            if drop_first_next and words_here:
+                words_here = words_here[1:]
+                drop_first_next = False
+
+            if i in joins:
+                stem, next_first = joins[i]
+                merged = stem + next_first
+                if words_here and words_here[-1].startswith(stem):
+                    words_here[-1] = merged
+                else:
+                    words_here.append(merged)
+                drop_first_next = True
+
+            yield line_number, words_here
+
+#True if a buffer (bytes or mmap) can take the ASCII fast path.
+def _ascii_safe(buf):
+    return _ASCII_UNSAFE_BRE.search(buf) is None and not (buf.find(b"\r") >= 0 and _LONE_CR_BRE.search(buf))
+
+#Memory-maps an open binary file if it can take the ASCII fast path, else None.
+def _map_ascii_file(fh):
+    if os.fstat(fh.fileno()).st_size == 0:
+        return None
+    mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    if not _ascii_safe(mm):
+        mm.close()
+        return None
+    return mm
+
+#Same as split_file_lines for the raw bytes of a file already read into memory
+#(see FileLoader). Decoding goes through the same universal-newline text layer
+#as open(..., "r"), so both give the same lines.
+def split_buffer_lines(data):
+    if data and _ascii_safe(data):
+        yield from profile_iter("tokenize", split_ascii_buffer(data), _line_word_count)
+        return
+    file = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8")
+    yield from profile_iter("tokenize", split_lines(iter_text_lines(file)), _line_word_count)
+
+#Yields (line_number, words) for a file, mapped ASCII fast path first and the
+#decoded text path (split_lines) otherwise. Both work through the file in
+#fixed-size pieces, so memory does not grow with the size of the file.
+#When data is given it holds the file's bytes and the file is not opened.
+#Compressed files are decompressed a chunk at a time into the text path.
+def split_file_lines(file_name, data=None):
+    if data is not None:
+        yield from split_buffer_lines(data)
+        return
+    opener = compressed_opener(file_name)
+    if opener is not None:
+        with opener(file_name, "rt", encoding="utf-8") as file:
+            yield from profile_iter("tokenize", split_lines(iter_text_lines(file)), _line_word_count)
+        return
+    with profile_stage("load"):
+        fh = open(file_name, "rb")
+        try:
+            mm = _map_ascii_file(fh)
+        except (OSError, ValueError):
+            mm = None
+        if mm is None:
+            fh.close()
+
+    if mm is None:
+        with open(file_name, "r", encoding="utf-8") as file:
+            yield from profile_iter("tokenize", split_lines(iter_text_lines(file)), _line_word_count)
+        return
+    try:
+        yield from profile_iter("tokenize", split_ascii_buffer(mm), _line_word_count)
+    finally:
+        mm.close()
+        fh.close()
+
+#This is the single tokenizer shared by the file summary, the word search,
+#the concordance and the extra lists. Each file is read once and every word
+#comes out as (word, line_number, word_number), already lowercased.
+def tokenize_file(file_name, data=None):
+    for line_number, words_here in split_file_lines(file_name, data):
+        for word_number, word in enumerate(words_here, start=1):
+            yield word, line_number, word_number
+
+def _line_word_count(item):
+    return len(item[1])
+
+#Returns the words of a file as a list per line (see split_lines).
+def split_file(file_name):
+    return [words_here for _line_number, words_here in split_file_lines(file_name)]
 
 # help enforce the hyphen to be considered as appearing before the letter a in SG2 reuiremnts
 def sort_key(word):
-   adjusted = word.lower().replace("-", "\x00")
-   return tuple(adjusted)
+   return tuple(collation_key(word))
+
+#The same ordering as sort_key but as a plain string, which is cheaper to
+#compare and can be written to a file (used by the spilled concordance).
+def collation_key(word):
+   return word.lower().replace("-", "\x00")
+
+
+#Tokenizes one file and returns its partial concordance:
+#word -> array('I') of flat (line_number, word_number) pairs. This is the
+#unit of work for the parallel build, so it has to stay a top-level
+#function; the packed arrays pickle as plain bytes and are added to the
+#concordance a word at a time (Concordance.extend_file).
+def index_file(file_name, data=None):
+    postings = {}
+    with profile_stage("index") as stage:
+        for word, line_number, word_number in tokenize_file(file_name, data):
+            pairs = postings.get(word)
+            if pairs is None:
+                pairs = postings[word] = array("I")
+            pairs.append(line_number)
+            pairs.append(word_number)
+        stage.add(sum(map(len, postings.values())) // 2)
+    return postings
+
+
+# Concurrent file loading
+# On slow or network storage most of the load time is spent waiting for reads.
+# FileLoader reads whole files on a thread pool (file reads release the GIL)
+# while the main thread tokenizes the files that have already arrived. At most
+# max_in_flight files are being read or waiting to be tokenized at any time,
+# which also bounds the memory held in buffers. Files always come back in the
+# order they were submitted, so file numbers do not depend on read timing.
+READ_AHEAD = 4
+
+#Compressed files are decompressed here, on the loader thread (zlib, bz2 and
+#lzma release the GIL), so several files decompress in parallel.
+def _read_file(file_name):
+    with profile_stage("load") as stage:
+        with (compressed_opener(file_name) or open)(file_name, "rb") as fh:
+            data = fh.read()
+        stage.add(len(data))
+    return data
+
+class FileLoader:
+
+    def __init__(self, max_in_flight=READ_AHEAD):
+        self.max_in_flight = max(1, max_in_flight)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        self._waiting = deque()   # names not yet started
+        self._reads = deque()     # (name, future) started, in submission order
+
+    def _start_reads(self):
+        while self._waiting and len(self._reads) < self.max_in_flight:
+            name = self._waiting.popleft()
+            self._reads.append((name, self._pool.submit(_read_file, name)))
+
+    #Queues a file; its read starts as soon as there is a free slot.
+    def submit(self, file_name):
+        self._waiting.append(file_name)
+        self._start_reads()
+
+    #Yields (file_name, future) in submission order; future.result() is the
+    #file's bytes or raises the read error. Each yielded slot is refilled
+    #before the caller starts tokenizing, so reads keep running meanwhile.
+    def __iter__(self):
+        self._start_reads()
+        while self._reads:
+            name, future = self._reads.popleft()
+            self._start_reads()
+            yield name, future
+
+    def close(self):
+        self._waiting.clear()
+        for _name, future in self._reads:
+            future.cancel()
+        self._reads.clear()
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+#Yields (file_name, future) for file_list in order, read max_in_flight at a
+#time ahead; future.result() is the file's bytes or raises the read error.
+def iter_file_reads(file_list, max_in_flight=READ_AHEAD):
+    with FileLoader(max_in_flight) as loader:
+        for file_name in file_list:
+            loader.submit(file_name)
+        yield from loader
+
+#Errors that make one input file unusable (unreadable, not UTF-8, a broken
+#compressed stream). Batch runs report such a file and go on without it.
+FILE_ERRORS = (OSError, UnicodeDecodeError, EOFError) + ((lzma.LZMAError,) if lzma is not None else ())
+
+#index_file, but returns the exception instead of raising it for FILE_ERRORS,
+#so one bad file does not stop a pool.map over the others.
+def index_file_or_error(file_name, data=None):
+    try:
+        return index_file(file_name, data)
+    except FILE_ERRORS as e:
+        return e
+
+
+#Yields index_file(...) for each file, in file_list order. With workers > 1
+#the files are tokenized in a process pool; pool.map hands the results back
+#in submission order, so callers can merge them as if they ran serially.
+#Otherwise read_ahead > 1 overlaps reading the next files with tokenizing
+#the current one (see FileLoader). errors=True yields the exception in place
+#of the postings of a file that fails with one of FILE_ERRORS.
+def iter_file_postings(file_list, workers=None, read_ahead=None, errors=False):
+    index = index_file_or_error if errors else index_file
+    if workers and workers > 1 and len(file_list) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(file_list))) as pool:
+            yield from pool.map(index, file_list)
+    elif read_ahead and read_ahead > 1 and len(file_list) > 1:
+        for filename, future in iter_file_reads(file_list, read_ahead):
+            try:
+                data = future.result()
+            except FILE_ERRORS as e:
+                if not errors:
+                    raise
+                yield e
+                continue
+            yield index(filename, data)
+    else:
+        for filename in file_list:
+            yield index(filename)
 
 
-#This variable it to build the concordance it will be able to return
-#Condance which will consit of one long list that will contain all the 
-#words in all the user indicated files
-def build_concordance(file_list):
-    concordance = {}
-    files_word_sets = []
+def _read_ahead_tokens(filename, future):
+    yield from tokenize_file(filename, future.result())
 
-    for file_index, filename in enumerate(file_list, start=1):
-        line_words = split_file(filename)
-        file_unique_words = set()
+#Yields (file_name, tokenize_file(...)) for each file in file_list order,
+#with read_ahead > 1 reading the next files while one is tokenized. Read and
+#decode errors are raised while the tokens are consumed.
+def iter_file_tokens(file_list, read_ahead=None):
+    if read_ahead and read_ahead > 1 and len(file_list) > 1:
+        for filename, future in iter_file_reads(file_list, read_ahead):
+            yield filename, _read_ahead_tokens(filename, future)
+    else:
+        for filename in file_list:
+            yield filename, tokenize_file(filename)
+
+#Adds one file's (word, line, word number) tokens straight into concordance
+#under file_index and returns the number of words. A concordance that cannot
+#count its own words (SpilledConcordance) is handed the file's word counts
+#with record_file() once the whole file has gone in.
+def add_file_tokens(concordance, file_index, tokens):
+    add = concordance.add
+    record_file = getattr(concordance, "record_file", None)
+    with profile_stage("index") as stage:
+        if record_file is None:
+            total = 0
+            for word, line_number, word_number in tokens:
+                add(word, file_index, line_number, word_number)
+                total += 1
+        else:
+            counts = Counter()
+            for word, line_number, word_number in tokens:
+                add(word, file_index, line_number, word_number)
+                counts[word] += 1
+            record_file(file_index, counts)
+            total = counts.total()
+        stage.add(total)
+    return total
+
+
+#Compact concordance used while indexing. Every word is interned once and
+#given an integer id; its positions live in one packed buffer per word
+#instead of a list of (file, line, word) tuples:
+#  - default: array('I') of flat triples, 12 bytes per occurrence
+#  - delta=True: varint bytes of (file gap, line gap or line, word number),
+#    usually 3 bytes per occurrence
+#Positions must be added in (file, line, word) order, which is the order the
+#tokenizer produces them. Reading a word gives back the same sorted list of
+#tuples the old dictionary held, so the writers do not need to change.
+class Concordance(Mapping):
+
+    def __init__(self, delta=False):
+        self.delta = delta
+        self._ids = {}             # word -> id (insertion order = first seen)
+        self._words = []           # id -> word
+        self._postings = []        # id -> array('I') or bytearray
+        self._counts = array("I")  # id -> number of occurrences
+        self._last_file = array("I")
+        self._last_line = array("I")
+        self.membership = FileMembership(self._words, self._ids)
+        self._mark = None          # see checkpoint()
+
+    def _word_id(self, word):
+        word_id = self._ids.get(word)
+        if word_id is None:
+            word_id = len(self._words)
+            self._ids[word] = word_id
+            self._words.append(word)
+            self._postings.append(bytearray() if self.delta else array("I"))
+            self._counts.append(0)
+            self._last_file.append(0)
+            self._last_line.append(0)
+        return word_id
+
+    def add(self, word, file_index, line_number, word_number):
+        word_id = self._word_id(word)
+        last_file = self._last_file[word_id]
+        if file_index != last_file:
+            self.membership.add(word_id, file_index)
+            if self._mark is not None and word_id < self._mark[1]:
+                # first position of an older word in this file: remember its state
+                self._mark[2].append((word_id, len(self._postings[word_id]), self._counts[word_id],
+                                      last_file, self._last_line[word_id]))
+        self._counts[word_id] += 1
+        if not self.delta:
+            self._postings[word_id].extend((file_index, line_number, word_number))
+            self._last_file[word_id] = file_index
+            return
+        buf = self._postings[word_id]
+        if file_index < last_file or (file_index == last_file and line_number < self._last_line[word_id]):
+            raise ValueError(f"positions for '{word}' must be added in order")
+        if file_index != last_file:
+            _put_varint(buf, file_index - last_file)
+            _put_varint(buf, line_number)
+        else:
+            _put_varint(buf, 0)
+            _put_varint(buf, line_number - self._last_line[word_id])
+        _put_varint(buf, word_number)
+        self._last_file[word_id] = file_index
+        self._last_line[word_id] = line_number
+
+    def extend(self, word, positions):
+        for file_index, line_number, word_number in positions:
+            self.add(word, file_index, line_number, word_number)
+
+    #Adds all positions of word in one file at once; pairs is an array('I')
+    #of flat (line, word number) pairs in order (see index_file).
+    def extend_file(self, word, file_index, pairs):
+        count = len(pairs) // 2
+        if not count:
+            return
+        word_id = self._word_id(word)
+        last_file = self._last_file[word_id]
+        if file_index < last_file or (self.delta and file_index == last_file
+                                      and pairs[0] < self._last_line[word_id]):
+            raise ValueError(f"positions for '{word}' must be added in order")
+        if file_index != last_file:
+            self.membership.add(word_id, file_index)
+            if self._mark is not None and word_id < self._mark[1]:
+                self._mark[2].append((word_id, len(self._postings[word_id]), self._counts[word_id],
+                                      last_file, self._last_line[word_id]))
+        self._counts[word_id] += count
+        if not self.delta:
+            triples = array("I", [file_index]) * (3 * count)
+            triples[1::3] = pairs[0::2]
+            triples[2::3] = pairs[1::2]
+            self._postings[word_id].extend(triples)
+            self._last_file[word_id] = file_index
+            return
+        buf = self._postings[word_id]
+        line_number = self._last_line[word_id] if file_index == last_file else None
+        for ln, wn in zip(pairs[0::2], pairs[1::2]):
+            if line_number is None:
+                _put_varint(buf, file_index - last_file)
+                _put_varint(buf, ln)
+            else:
+                _put_varint(buf, 0)
+                _put_varint(buf, ln - line_number)
+            _put_varint(buf, wn)
+            line_number = ln
+        self._last_file[word_id] = file_index
+        self._last_line[word_id] = line_number
+
+    #Marks the start of file file_index, so rollback() can take the file out
+    #again if it fails part way through. Only the first position of each
+    #older word in the file is noted, so the cost is per distinct word.
+    def checkpoint(self, file_index):
+        self._mark = (file_index, len(self._words), [])
+
+    #Removes everything added since checkpoint().
+    def rollback(self):
+        file_index, word_count, touched = self._mark
+        self._mark = None
+        for word_id, size, count, last_file, last_line in touched:
+            del self._postings[word_id][size:]
+            self._counts[word_id] = count
+            self._last_file[word_id] = last_file
+            self._last_line[word_id] = last_line
+        for word in self._words[word_count:]:
+            del self._ids[word]
+        for table in (self._words, self._postings, self._counts, self._last_file, self._last_line):
+            del table[word_count:]
+        self.membership.clear_file(file_index)
+
+    #Flat array('I') of (file, line, word) triples for one word.
+    def flat(self, word):
+        word_id = self._ids[word]
+        if not self.delta:
+            return self._postings[word_id]
+        flat = array("I")
+        file_index = line_number = 0
+        values = _iter_varints(self._postings[word_id])
+        for file_gap, line_part, word_number in zip(values, values, values):
+            if file_gap:
+                file_index += file_gap
+                line_number = line_part
+            else:
+                line_number += line_part
+            flat.extend((file_index, line_number, word_number))
+        return flat
 
-        for line_number, words_on_line in enumerate(line_words, start=1):
-            for word_number, word in enumerate(words_on_line, start=1):
-                file_unique_words.add(word)
-                if word not in concordance:
-                    concordance[word] = []
-                concordance[word].append((file_index, line_number, word_number))
+    def count(self, word):
+        return self._counts[self._ids[word]]
 
-        files_word_sets.append(file_unique_words)
+    def __getitem__(self, word):
+        flat = self.flat(word)
+        return list(zip(flat[0::3], flat[1::3], flat[2::3]))
 
-    for word, positions in concordance.items():
-        positions.sort()
+    def __contains__(self, word):
+        return word in self._ids
+
+    def __iter__(self):
+        return iter(self._words)
+
+    def __len__(self):
+        return len(self._words)
+
+
+def _put_varint(buf, n):
+    while n >= 0x80:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
 
-    return concordance, files_word_sets
+
+def _iter_varints(buf):
+    n = shift = 0
+    for byte in buf:
+        n |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            yield n
+            n = shift = 0
+
+
+# File membership bitsets
+# For the extra lists only the set of files a word appears in matters. Each
+# file keeps one bitmap over word ids (a bytearray while indexing, a Python int
+# for queries), so set questions about all words become a handful of big-int
+# operations per file instead of a Python set per word:
+#   in every file      AND of the file bitmaps
+#   in one file        bit-sliced counter, count == 1
+#   in >= k files      bit-sliced counter compared with k
+#   files i and j      popcount(bitmap i & bitmap j)
+# The counter keeps the number of files per word as binary digits spread over
+# log2(files) bitmaps ("planes"), and is built with ripple-carry additions.
+
+def _bit_positions(n):
+    #Indexes of the set bits of n, lowest first.
+    bits = bin(n)[:1:-1]
+    i = bits.find("1")
+    while i >= 0:
+        yield i
+        i = bits.find("1", i + 1)
+
+class FileMembership:
+
+    def __init__(self, words=None, ids=None):
+        # Concordance passes its own word list and ids so the two share them
+        self.words = [] if words is None else words   # id -> word
+        self._ids = {} if ids is None else ids        # word -> id
+        self._files = []    # file number - 1 -> bytearray bitmap over word ids
+        self._cache = None  # (file bitmaps as ints, counter planes) until the next add
+
+    #Records that the word with word_id occurs in file_number (1-based).
+    def add(self, word_id, file_number):
+        while len(self._files) < file_number:
+            self._files.append(bytearray())
+        bitmap = self._files[file_number - 1]
+        byte = word_id >> 3
+        if len(bitmap) <= byte:
+            bitmap.extend(bytes(byte + 1 - len(bitmap)))
+        bitmap[byte] |= 1 << (word_id & 7)
+        self._cache = None
+
+    #Forgets every word of file_number (a file that failed to load).
+    def clear_file(self, file_number):
+        if file_number <= len(self._files):
+            self._files[file_number - 1] = bytearray()
+            while self._files and not any(self._files[-1]):
+                self._files.pop()
+            self._cache = None
+
+    def add_word(self, word, file_number):
+        word_id = self._ids.get(word)
+        if word_id is None:
+            word_id = self._ids[word] = len(self.words)
+            self.words.append(word)
+        self.add(word_id, file_number)
+
+    #Builds the membership of any concordance mapping (sorted positions).
+    @classmethod
+    def from_concordance(cls, concordance):
+        membership = getattr(concordance, "membership", None)
+        if membership is not None:
+            return membership
+        membership = cls()
+        for word, positions in concordance.items():
+            last = 0
+            for f, _ln, _wn in positions:
+                if f != last:
+                    membership.add_word(word, f)
+                    last = f
+        return membership
+
+    def _state(self):
+        if self._cache is None:
+            bitmaps = [int.from_bytes(b, "little") for b in self._files]
+            planes = []
+            for bitmap in bitmaps:
+                carry = bitmap
+                for i, plane in enumerate(planes):
+                    if not carry:
+                        break
+                    planes[i], carry = plane ^ carry, plane & carry
+                if carry:
+                    planes.append(carry)
+            self._cache = (bitmaps, planes)
+        return self._cache
+
+    def _words_of(self, bits):
+        return [self.words[i] for i in _bit_positions(bits)]
+
+    #Bitmap of the words whose file count is at least k.
+    def _at_least_bits(self, k):
+        _bitmaps, planes = self._state()
+        mask = (1 << len(self.words)) - 1
+        if k <= 0:
+            return mask
+        if k >> len(planes):
+            return 0
+        greater, equal = 0, mask
+        for bit in range(len(planes) - 1, -1, -1):
+            plane = planes[bit]
+            if (k >> bit) & 1:
+                equal &= plane
+            else:
+                greater |= equal & plane
+                equal &= mask ^ plane
+        return greater | equal
+
+    #Number of files the word appears in.
+    def file_count(self, word):
+        word_id = self._ids[word]
+        _bitmaps, planes = self._state()
+        return sum(((plane >> word_id) & 1) << bit for bit, plane in enumerate(planes))
+
+    #Words found in every one of the first file_count files.
+    def in_all(self, file_count=None):
+        bitmaps, _planes = self._state()
+        file_count = len(bitmaps) if file_count is None else file_count
+        if not file_count or file_count > len(bitmaps):
+            return []
+        bits = bitmaps[0]
+        for bitmap in bitmaps[1:file_count]:
+            bits &= bitmap
+        return self._words_of(bits)
+
+    #Words found in at least k files.
+    def at_least(self, k):
+        return self._words_of(self._at_least_bits(k))
+
+    #(word, file number) for the words found in exactly one file.
+    def only_one(self):
+        bitmaps, _planes = self._state()
+        once = self._at_least_bits(1) & ~self._at_least_bits(2)
+        rows = []
+        for number, bitmap in enumerate(bitmaps, start=1):
+            hits = once & bitmap
+            if hits:
+                rows.extend((word, number) for word in self._words_of(hits))
+        return rows
+
+    #Number of words files i and j (1-based) have in common.
+    def overlap(self, i, j):
+        bitmaps, _planes = self._state()
+        return (bitmaps[i - 1] & bitmaps[j - 1]).bit_count()
+
+    #overlap(i, j) for every pair of files, as a list of rows.
+    def overlap_matrix(self):
+        bitmaps, _planes = self._state()
+        return [[(a & b).bit_count() for b in bitmaps] for a in bitmaps]
+
+
+#Appends one file's partial concordance under file number file_index.
+def merge_file_postings(concordance, file_index, postings):
+    for word, pairs in postings.items():
+        concordance.extend_file(word, file_index, pairs)
+
+
+#Rough memory cost of one buffered (key, file, line, word) entry in bytes
+SPILL_ENTRY_BYTES = 100
+#Most run files merged at once; more runs are first merged in groups
+SPILL_MAX_FANIN = 128
+
+
+#Bounded-memory concordance for corpora that do not fit in RAM.
+#Positions are buffered as (collation key, file, line, word) until the
+#memory budget is reached, then sorted and spilled to a run file in a
+#temporary directory. Reading it back is a streaming k-way merge of the
+#runs (heapq.merge), so words come out in sort_key order with their
+#positions sorted, and only one word's positions are held at a time.
+#It supports add() like Concordance but not random access by word.
+class SpilledConcordance:
+
+    def __init__(self, memory_budget, tmp_dir=None):
+        self._limit = max(1, memory_budget // SPILL_ENTRY_BYTES)
+        self._buffer = []
+        self._runs = []
+        self._run_number = 0
+        self._mark = None
+        self._tmp = tempfile.TemporaryDirectory(prefix="sg2-runs-", dir=tmp_dir)
+        # statistics of the files added so far (see record_file), so the
+        # summary and extra lists do not have to merge the runs again
+        self.membership = FileMembership()
+        self.totals = Counter()   # word -> occurrences
+        self._file_stats = []     # file number - 1 -> (total words, distinct words)
+
+    def add(self, word, file_index, line_number, word_number):
+        self._buffer.append((collation_key(word), file_index, line_number, word_number))
+        if len(self._buffer) >= self._limit:
+            self._spill()
+
+    #Records the word counts ({word: occurrences}) of file file_index once all
+    #of its positions have been added.
+    def record_file(self, file_index, counts):
+        for word in counts:
+            self.membership.add_word(word, file_index)
+        self.totals.update(counts)
+        while len(self._file_stats) < file_index:
+            self._file_stats.append((0, 0))
+        self._file_stats[file_index - 1] = (sum(counts.values()), len(counts))
+
+    #(total words, distinct words) per file, in file number order.
+    def file_stats(self):
+        return list(self._file_stats)
+
+    #Concordance.extend_file for the spilled buffer.
+    def extend_file(self, word, file_index, pairs):
+        count = len(pairs) // 2
+        self._buffer.extend(zip(repeat(collation_key(word), count), repeat(file_index, count),
+                                pairs[0::2], pairs[1::2]))
+        if len(self._buffer) >= self._limit:
+            self._spill()
+
+    #Marks the start of file file_index (see Concordance.checkpoint).
+    def checkpoint(self, file_index):
+        self._mark = (file_index, len(self._runs))
+
+    #Removes everything added since checkpoint(). Runs written since then are
+    #rewritten without the file; this only happens when a file fails to load.
+    def rollback(self):
+        file_index, run_count = self._mark
+        self._mark = None
+        self._buffer = [entry for entry in self._buffer if entry[1] != file_index]
+        for i in range(run_count, len(self._runs)):
+            old_path = self._runs[i]
+            self._runs[i] = self._write_run(entry for entry in self._merged([old_path]) if entry[1] != file_index)
+            os.remove(old_path)
+
+    def _write_run(self, entries):
+        path = os.path.join(self._tmp.name, f"run{self._run_number:06d}.txt")
+        self._run_number += 1
+        with open(path, "w", encoding="utf-8", newline="\n") as fh:
+            fh.writelines(f"{key}\t{f}\t{ln}\t{wn}\n" for key, f, ln, wn in entries)
+        return path
+
+    def _spill(self):
+        with profile_stage("concordance sort") as stage:
+            self._buffer.sort()
+            stage.add(len(self._buffer))
+        self._runs.append(self._write_run(self._buffer))
+        self._buffer = []
+
+    def _merged(self, paths):
+        handles = [open(path, "r", encoding="utf-8", newline="\n") for path in paths]
+        try:
+            yield from heapq.merge(*(map(_parse_run_line, fh) for fh in handles))
+        finally:
+            for fh in handles:
+                fh.close()
+
+    #Merges groups of runs into longer runs until one merge pass is enough,
+    #so the number of open files stays under SPILL_MAX_FANIN. Each group is
+    #only as large as needed to get there, so little data is merged twice.
+    def _compact_runs(self):
+        while len(self._runs) > SPILL_MAX_FANIN:
+            size = min(SPILL_MAX_FANIN, len(self._runs) - SPILL_MAX_FANIN + 1)
+            group, self._runs = self._runs[:size], self._runs[size:]
+            self._runs.append(self._write_run(self._merged(group)))
+            for path in group:
+                os.remove(path)
+
+    #Yields (word, iterator of positions) in sort_key order. The positions
+    #iterator must be consumed before moving on to the next word.
+    def iter_sorted(self):
+        if self._buffer:
+            self._spill()
+        self._compact_runs()
+        for key, group in groupby(self._merged(self._runs), key=itemgetter(0)):
+            yield key.replace("\x00", "-"), ((f, ln, wn) for _key, f, ln, wn in group)
+
+    def items(self):
+        for word, positions in self.iter_sorted():
+            yield word, list(positions)
+
+    def keys(self):
+        for word, positions in self.iter_sorted():
+            for _ in positions:
+                pass
+            yield word
+
+    def close(self):
+        self._tmp.cleanup()
+
+
+def _parse_run_line(line):
+    key, f, ln, wn = line.rstrip("\n").split("\t")
+    return key, int(f), int(ln), int(wn)
+
+
+#This variable it to build the concordance it will be able to return
+#Condance which will consit of one long list that will contain all the 
+#words in all the user indicated files
+#Files are tokenized straight into the concordance. workers > 1 tokenizes
+#them in that many processes instead; the partial results are merged in file
+#order so the concordance is the same as the serial one.
+#delta=True keeps the postings delta/varint encoded (see Concordance).
+#memory_budget (bytes) switches to a SpilledConcordance that sorts to disk.
+#Returns (concordance, FileMembership of every word).
+#When a skipped list is given, files failing with FILE_ERRORS are appended to
+#it as (filename, error) and left out without using up a file number;
+#otherwise the error is raised.
+def build_concordance(file_list, workers=None, delta=False, memory_budget=None, read_ahead=None,
+                      skipped=None):
+    if memory_budget:
+        concordance = SpilledConcordance(memory_budget)
+    else:
+        concordance = Concordance(delta)
+    membership = concordance.membership  # kept up to date while adding
+
+    # files are added in order and each file's positions are already
+    # sorted, so every word's postings come out sorted without a sort pass
+    file_index = 1
+    if workers and workers > 1 and len(file_list) > 1:
+        results = iter_file_postings(file_list, workers, errors=skipped is not None)
+        for filename, postings in zip(file_list, results):
+            if isinstance(postings, Exception):
+                skipped.append((filename, postings))
+                continue
+            merge_file_postings(concordance, file_index, postings)
+            if memory_budget:
+                concordance.record_file(file_index, {word: len(pairs) // 2 for word, pairs in postings.items()})
+            file_index += 1
+    else:
+        for filename, tokens in iter_file_tokens(file_list, read_ahead):
+            concordance.checkpoint(file_index)
+            try:
+                add_file_tokens(concordance, file_index, tokens)
+            except FILE_ERRORS as e:
+                if skipped is None:
+                    raise
+                concordance.rollback()
+                skipped.append((filename, e))
+                continue
+            file_index += 1
+
+    return concordance, membership
+
+
+# Persistent concordance index
+# The index file holds everything needed to answer searches and rewrite
+# CONCORDANCE.TXT / ExtraLists.txt without reading the source texts again.
+# Layout (all little-endian):
+#   header | file table | term table | term strings | postings
+# The term table is sorted with sort_key so lookups are a binary search,
+# and postings are (file, line, word) triples of unsigned 32-bit ints.
+INDEX_FILE = "CONCORDANCE.IDX"
+INDEX_MAGIC = b"SG2IDX"
+INDEX_VERSION = 1
+_INDEX_HEADER = struct.Struct("<6sHIIQQQQ")  # magic, version, files, terms, 4 section offsets
+_INDEX_FILE_ENTRY = struct.Struct("<QQ32sH")  # size, mtime_ns, sha256, name length
+_INDEX_TERM_ENTRY = struct.Struct("<QIQI")    # string offset, string length, postings offset, postings count
+_HASH_CHUNK = 1 << 20
+
+
+#This returns (size, mtime_ns, sha256 digest) for a file. When a previous
+#fingerprint is given and size and mtime still match, the file is not hashed again.
+def file_fingerprint(file_name, known=None):
+    st = os.stat(file_name)
+    if known is not None and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+        return known
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as fh:
+        for chunk in iter(lambda: fh.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return (st.st_size, st.st_mtime_ns, digest.digest())
+
+
+def _postings_array(concordance, word):
+    if hasattr(concordance, "flat"):
+        flat = array("I", concordance.flat(word))
+    else:
+        flat = array("I")
+        for triple in concordance[word]:
+            flat.extend(triple)
+    if sys.byteorder == "big":
+        flat.byteswap()
+    return flat
+
+
+#This writes the concordance to an index file. The file is written next to
+#the target and then renamed over it, so an index that is still mapped by
+#this process (or another one) is never truncated underneath it.
+#Windows will not rename over a file that is mapped, so an open
+#ConcordanceIndex of index_path is passed as replacing and closed just
+#before the rename (after the concordance, which may be that index, is written).
+def save_index(concordance, file_list, fingerprints, index_path=INDEX_FILE, replacing=None):
+    words = sorted(concordance.keys(), key=sort_key)
+    encoded_names = [fname.encode("utf-8") for fname in file_list]
+    encoded_words = [w.encode("utf-8") for w in words]
+
+    files_off = _INDEX_HEADER.size
+    terms_off = files_off + sum(_INDEX_FILE_ENTRY.size + len(n) for n in encoded_names)
+    strings_off = terms_off + _INDEX_TERM_ENTRY.size * len(words)
+    postings_off = strings_off + sum(len(w) for w in encoded_words)
+
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(_INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(file_list), len(words),
+                                    files_off, terms_off, strings_off, postings_off))
+        for name, (size, mtime_ns, digest) in zip(encoded_names, fingerprints):
+            fh.write(_INDEX_FILE_ENTRY.pack(size, mtime_ns, digest, len(name)))
+            fh.write(name)
+        string_pos = 0
+        posting_pos = 0
+        for word, raw in zip(words, encoded_words):
+            count = concordance.count(word) if hasattr(concordance, "count") else len(concordance[word])
+            fh.write(_INDEX_TERM_ENTRY.pack(string_pos, len(raw), posting_pos, count))
+            string_pos += len(raw)
+            posting_pos += count
+        for raw in encoded_words:
+            fh.write(raw)
+        for word in words:
+            _postings_array(concordance, word).tofile(fh)
+    if replacing is not None:
+        replacing.close()
+    os.replace(tmp_path, index_path)
+
+
+#Read-only, memory-mapped view of a saved index. It behaves like the
+#concordance dictionary (word -> sorted list of positions) so it can be
+#passed straight to print_and_write_concordance and write_extra_lists.
+class ConcordanceIndex(Mapping):
+
+    def __init__(self, index_path):
+        with open(index_path, "rb") as fh:
+            self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < _INDEX_HEADER.size:
+            raise ValueError(f"'{index_path}' is not a concordance index")
+        (magic, version, file_count, self._term_count, files_off,
+         self._terms_off, self._strings_off, self._postings_off) = _INDEX_HEADER.unpack_from(self._mm, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(f"'{index_path}' is not a version {INDEX_VERSION} concordance index")
+
+        self.file_list = []
+        self.fingerprints = []
+        pos = files_off
+        for _ in range(file_count):
+            size, mtime_ns, digest, name_len = _INDEX_FILE_ENTRY.unpack_from(self._mm, pos)
+            pos += _INDEX_FILE_ENTRY.size
+            self.file_list.append(self._mm[pos:pos + name_len].decode("utf-8"))
+            self.fingerprints.append((size, mtime_ns, digest))
+            pos += name_len
+
+    def _entry(self, i):
+        return _INDEX_TERM_ENTRY.unpack_from(self._mm, self._terms_off + i * _INDEX_TERM_ENTRY.size)
+
+    def _term(self, i):
+        str_off, str_len, _p_off, _count = self._entry(i)
+        start = self._strings_off + str_off
+        return self._mm[start:start + str_len].decode("utf-8")
+
+    def _find(self, word):
+        target = sort_key(word)
+        lo, hi = 0, self._term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if sort_key(self._term(mid)) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._term_count and self._term(lo) == word:
+            return lo
+        return None
+
+    def _flat(self, i):
+        _s_off, _s_len, p_off, count = self._entry(i)
+        start = self._postings_off + p_off * 12
+        flat = array("I")
+        flat.frombytes(self._mm[start:start + count * 12])
+        if sys.byteorder == "big":
+            flat.byteswap()
+        return flat
+
+    def _positions(self, i):
+        flat = self._flat(i)
+        return list(zip(flat[0::3], flat[1::3], flat[2::3]))
+
+    def flat(self, word):
+        i = self._find(word)
+        if i is None:
+            raise KeyError(word)
+        return self._flat(i)
+
+    def count(self, word):
+        i = self._find(word)
+        if i is None:
+            raise KeyError(word)
+        return self._entry(i)[3]
+
+    def __getitem__(self, word):
+        i = self._find(word)
+        if i is None:
+            raise KeyError(word)
+        return self._positions(i)
+
+    def __contains__(self, word):
+        return self._find(word) is not None
+
+    def __iter__(self):
+        for i in range(self._term_count):
+            yield self._term(i)
+
+    def __len__(self):
+        return self._term_count
+
+    def items(self):
+        # Walk the term table once instead of a binary search per word.
+        for i in range(self._term_count):
+            yield self._term(i), self._positions(i)
+
+    #(total words, distinct words) per file, in file_list order.
+    def file_stats(self):
+        totals = [0] * len(self.file_list)
+        distinct = [0] * len(self.file_list)
+        for i in range(self._term_count):
+            files = self._flat(i)[0::3]
+            for file_num in files:
+                totals[file_num - 1] += 1
+            for file_num in set(files):
+                distinct[file_num - 1] += 1
+        return list(zip(totals, distinct))
+
+    def close(self):
+        self._mm.close()
+
+
+#Opens an existing index, or returns None if it is missing or unreadable.
+def open_index(index_path=INDEX_FILE):
+    try:
+        return ConcordanceIndex(index_path)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+#Answers a word search straight from an index: filename -> count.
+def search_index(index, word):
+    results = {fname: 0 for fname in index.file_list}
+    if word in index:
+        for file_num in index.flat(word)[0::3]:
+            results[index.file_list[file_num - 1]] += 1
+    return results
+
+
+#This returns a concordance for file_list using the index at index_path.
+#Files whose size and mtime (or, failing that, content hash) match the index
+#are not parsed again; their positions are copied out of the index. If every
+#file is unchanged and in the same order, the mapped index itself is returned.
+#Otherwise the changed files are parsed (in workers processes when > 1, or
+#with read_ahead files read concurrently) and the index is rewritten.
+def load_or_build_concordance(file_list, index_path=INDEX_FILE, workers=None, delta=False, read_ahead=None,
+                              skipped=None):
+    index = open_index(index_path)
+    old_numbers = {}
+    if index is not None:
+        old_numbers = {fname: n for n, fname in enumerate(index.file_list, start=1)}
+
+    fingerprints = {}
+    unchanged = {}  # filename -> old file number
+    for filename in file_list:
+        old = old_numbers.get(filename)
+        known = index.fingerprints[old - 1] if old else None
+        try:
+            fp = file_fingerprint(filename, known)
+        except OSError as e:
+            if skipped is None:
+                raise
+            skipped.append((filename, e))
+            continue
+        fingerprints[filename] = fp
+        if known is not None and fp[2] == known[2]:
+            unchanged[filename] = old
+    listed = [filename for filename in file_list if filename in fingerprints]
+
+    if (index is not None and len(unchanged) == len(listed) == len(index.file_list)
+            and all(unchanged[filename] == n for n, filename in enumerate(listed, start=1))):
+        listed_fingerprints = [fingerprints[filename] for filename in listed]
+        if listed_fingerprints != index.fingerprints:
+            # contents unchanged but mtimes moved; refresh them for next time
+            save_index(index, listed, listed_fingerprints, index_path, replacing=index)
+            index = ConcordanceIndex(index_path)
+        return index
+
+    # Changed files are tokenized straight into their own packed concordance
+    # under their new file numbers. Numbers are handed out in list order as
+    # files succeed, so a file that fails does not leave a gap.
+    changed = [filename for filename in listed if filename not in unchanged]
+    fresh = Concordance(delta)
+    use_pool = workers and workers > 1 and len(changed) > 1
+    if use_pool:
+        changed_postings = iter_file_postings(changed, workers, errors=skipped is not None)
+    else:
+        changed_tokens = iter_file_tokens(changed, read_ahead)
+    reuse = {}  # old file number -> new file number
+    kept_files = []
+    for filename in listed:
+        file_index = len(kept_files) + 1
+        if filename in unchanged:
+            reuse[unchanged[filename]] = file_index
+            kept_files.append(filename)
+            continue
+        fresh.checkpoint(file_index)
+        try:
+            if use_pool:
+                postings = next(changed_postings)
+                if isinstance(postings, Exception):
+                    raise postings
+                merge_file_postings(fresh, file_index, postings)
+            else:
+                _name, tokens = next(changed_tokens)
+                add_file_tokens(fresh, file_index, tokens)
+        except FILE_ERRORS as e:
+            if skipped is None:
+                raise
+            fresh.rollback()
+            skipped.append((filename, e))
+            continue
+        kept_files.append(filename)
+
+    if not reuse:
+        packed = fresh
+    else:
+        # Word by word, the reused positions (renumbered; resorted only if
+        # the files changed order) are merged with the fresh ones, so no
+        # corpus-wide list of positions is ever built.
+        in_order = sorted(reuse.values()) == [reuse[old] for old in sorted(reuse)]
+        packed = Concordance(delta)
+        for word in index:
+            flat = index.flat(word)
+            kept = [(reuse[f], ln, wn) for f, ln, wn in zip(flat[0::3], flat[1::3], flat[2::3]) if f in reuse]
+            if not in_order:
+                kept.sort()
+            if word in fresh:
+                kept = heapq.merge(kept, fresh[word])
+            elif not kept:
+                continue  # only in files that changed or were dropped
+            packed.extend(word, kept)
+        for word in fresh:
+            if word not in packed:
+                packed.extend(word, fresh[word])
+
+    save_index(packed, kept_files, [fingerprints[filename] for filename in kept_files], index_path,
+               replacing=index)
+    return packed
+
+
+# Incremental updates
+# IncrementalConcordance keeps each word's positions per file, so one file can
+# be added, re-indexed or removed without touching the postings of the rest.
+# File numbers are stable: a new file gets the next number, a modified file
+# keeps its number and a removed file leaves its number unused. Next to the
+# positions it keeps what the extra lists need, updated with every change:
+#   totals        word -> occurrences over all files
+#   file buckets  number of files -> words found in that many files, so
+#                 "in every file" and "in only one file" are single lookups
+#   top heap      (-occurrences, collation key, word) entries; entries go
+#                 stale when a count changes and are skipped when read
+# The cost of an update is proportional to the words of the changed file.
+
+class IncrementalConcordance(Mapping):
+
+    def __init__(self):
+        self.files = []          # file number - 1 -> filename (None once removed)
+        self.fingerprints = []   # file number - 1 -> file_fingerprint (None once removed)
+        self._numbers = {}       # filename -> file number
+        self._postings = {}      # word -> {file number: array('I') of line, word pairs}
+        self._file_words = {}    # file number -> Counter of the file's words
+        self.totals = Counter()
+        self._by_file_count = defaultdict(set)
+        self._top_heap = []
+
+    @property
+    def file_list(self):
+        #Names of the files currently indexed, in file-number order.
+        return [name for name in self.files if name is not None]
+
+    def file_number(self, file_name):
+        return self._numbers[file_name]
+
+    def word_counts(self, file_name):
+        #Counter of the words in one file (the shape the search loop uses).
+        return self._file_words[self._numbers[file_name]]
+
+    def _move_bucket(self, word, old, new):
+        if old:
+            self._by_file_count[old].discard(word)
+        if new:
+            self._by_file_count[new].add(word)
+
+    def _put(self, number, postings):
+        counts = Counter()
+        for word, pairs in postings.items():
+            per_file = self._postings.setdefault(word, {})
+            per_file[number] = pairs
+            self._move_bucket(word, len(per_file) - 1, len(per_file))
+            counts[word] = len(pairs) // 2
+            self.totals[word] += len(pairs) // 2
+            heapq.heappush(self._top_heap, (-self.totals[word], collation_key(word), word))
+        self._file_words[number] = counts
+
+    def _drop(self, number):
+        for word, count in self._file_words.pop(number).items():
+            per_file = self._postings[word]
+            del per_file[number]
+            self._move_bucket(word, len(per_file) + 1, len(per_file))
+            if per_file:
+                self.totals[word] -= count
+                heapq.heappush(self._top_heap, (-self.totals[word], collation_key(word), word))
+            else:
+                del self._postings[word]
+                del self.totals[word]
+        if len(self._top_heap) > 2 * len(self.totals) + 1024:
+            self._top_heap = [(-total, collation_key(w), w) for w, total in self.totals.items()]
+            heapq.heapify(self._top_heap)
+
+    #Indexes a new file under the next file number and returns that number.
+    #postings is index_file(file_name) when the caller already has it.
+    def add_file(self, file_name, postings=None, fingerprint=None):
+        if file_name in self._numbers:
+            raise ValueError(f"'{file_name}' is already indexed")
+        if postings is None:
+            postings = index_file(file_name)
+        self.files.append(file_name)
+        self.fingerprints.append(fingerprint or file_fingerprint(file_name))
+        number = self._numbers[file_name] = len(self.files)
+        self._put(number, postings)
+        return number
+
+    #Re-indexes a file that changed on disk; it keeps its file number.
+    def update_file(self, file_name, postings=None, fingerprint=None):
+        number = self._numbers[file_name]
+        if postings is None:
+            postings = index_file(file_name)
+        self._drop(number)
+        self.fingerprints[number - 1] = fingerprint or file_fingerprint(file_name)
+        self._put(number, postings)
+        return number
+
+    def remove_file(self, file_name):
+        number = self._numbers.pop(file_name)
+        self._drop(number)
+        self.files[number - 1] = None
+        self.fingerprints[number - 1] = None
+        return number
+
+    #Compares file_list with the indexed files without changing anything.
+    #Unchanged files are only stat'ed (see file_fingerprint). Returns
+    #(added, modified, removed, fingerprints) where fingerprints maps every
+    #listed filename to its current fingerprint. With a skipped list, files
+    #that cannot be read are appended to it as (filename, error) and treated
+    #as if they were not listed.
+    def changes(self, file_list, skipped=None):
+        fingerprints = {}
+        for name in dict.fromkeys(file_list):
+            number = self._numbers.get(name)
+            known = self.fingerprints[number - 1] if number else None
+            try:
+                fingerprints[name] = file_fingerprint(name, known)
+            except OSError as e:
+                if skipped is None:
+                    raise
+                skipped.append((name, e))
+        removed = [name for name in self.file_list if name not in fingerprints]
+        added, modified = [], []
+        for name, fp in fingerprints.items():
+            number = self._numbers.get(name)
+            known = self.fingerprints[number - 1] if number else None
+            if known is None:
+                added.append(name)
+            elif fp[2] != known[2]:
+                modified.append(name)
+        return added, modified, removed, fingerprints
+
+    #Applies the result of changes(); postings yields index_file(...) for
+    #modified + added, in that order. With a skipped list, postings may hold
+    #the exception of a file that failed to index (iter_file_postings with
+    #errors=True); the file is appended to skipped and left out of the index,
+    #so a later apply tries it again.
+    def apply_changes(self, changes, postings, skipped=None):
+        added, modified, removed, fingerprints = changes
+        for name in removed:
+            self.remove_file(name)
+        failed = set()
+        for name, file_postings in zip(modified + added, postings):
+            if isinstance(file_postings, BaseException):
+                if skipped is None:
+                    raise file_postings
+                skipped.append((name, file_postings))
+                failed.add(name)
+                if name in self._numbers:
+                    self.remove_file(name)
+            elif name in self._numbers:
+                self.update_file(name, file_postings, fingerprints[name])
+            else:
+                self.add_file(name, file_postings, fingerprints[name])
+        for name, fp in fingerprints.items():
+            if name not in failed:
+                self.fingerprints[self._numbers[name] - 1] = fp  # same content, new mtime
+
+    #Brings the concordance in line with file_list: files no longer listed are
+    #removed, files whose content changed are re-indexed and new files are
+    #added in list order. Returns (added, modified, removed) filenames.
+    #With a skipped list, unreadable files are reported there instead of
+    #raising (see apply_changes).
+    def apply(self, file_list, workers=None, read_ahead=None, skipped=None):
+        changes = self.changes(file_list, skipped)
+        added, modified, removed, _fingerprints = changes
+        self.apply_changes(changes, iter_file_postings(modified + added, workers, read_ahead,
+                                                       errors=skipped is not None), skipped)
+        return added, modified, removed
+
+    #{filename: occurrences} for the files that contain word.
+    def file_counts(self, word):
+        per_file = self._postings.get(word, {})
+        return {self.files[f - 1]: len(pairs) // 2 for f, pairs in sorted(per_file.items())}
+
+    #Rows of the extra lists (see extra_lists) from the maintained statistics.
+    def extra_lists(self, n=10):
+        top_rows = []
+        kept = []
+        seen = set()
+        heap = self._top_heap
+        while heap and len(top_rows) < n:
+            entry = heapq.heappop(heap)
+            word = entry[2]
+            if word in seen or self.totals.get(word) != -entry[0]:
+                continue  # stale or repeated entry
+            seen.add(word)
+            kept.append(entry)
+            top_rows.append([word, -entry[0], len(self._postings[word])])
+        for entry in kept:
+            heapq.heappush(heap, entry)
+
+        file_count = len(self._numbers)
+        in_all = sorted(self._by_file_count.get(file_count, ()), key=sort_key) if file_count else []
+        only_one = sorted(([w, next(iter(self._postings[w]))] for w in self._by_file_count.get(1, ())),
+                          key=lambda row: sort_key(row[0]))
+        return top_rows, in_all, only_one
+
+    def flat(self, word):
+        per_file = self._postings[word]
+        flat = array("I")
+        for f in sorted(per_file):
+            pairs = per_file[f]
+            for i in range(0, len(pairs), 2):
+                flat.extend((f, pairs[i], pairs[i + 1]))
+        return flat
+
+    def count(self, word):
+        return self.totals.get(word, 0)
+
+    def __getitem__(self, word):
+        flat = self.flat(word)
+        return list(zip(flat[0::3], flat[1::3], flat[2::3]))
+
+    def __contains__(self, word):
+        return word in self._postings
+
+    def __iter__(self):
+        return iter(self._postings)
+
+    def __len__(self):
+        return len(self._postings)
+
+
+# Output formats
+# Next to the usual text layout the concordance and extra lists can be written as:
+#   csv    - CONCORDANCE.csv: word,file,line,position (one row per occurrence)
+#            ExtraLists.csv:  list,word,occurrences,files,file
+#   jsonl  - CONCORDANCE.jsonl: {"word": w, "positions": [[file, line, position], ...]}
+#            ExtraLists.jsonl:  {"list": "top"|"all"|"one", "word": w, ...}
+#   binary - CONCORDANCE.bin: magic, then per word: <HI> word length and
+#            occurrence count, the UTF-8 word, then count <III> positions
+#            ExtraLists.bin:  magic, then per row: <BHII> list id (1 top,
+#            2 all, 3 one), word length, two numbers, then the UTF-8 word
+# All numbers are little-endian. Files are written through large buffers.
+OUTPUT_FORMATS = ("text", "csv", "jsonl", "binary")
+OUTPUT_BUFFER_SIZE = 1 << 20
+CONCORDANCE_BIN_MAGIC = b"SG2CONC1"
+EXTRA_LISTS_BIN_MAGIC = b"SG2XTRA1"
+_FORMAT_SUFFIX = {"csv": ".csv", "jsonl": ".jsonl", "binary": ".bin"}
+_BIN_WORD_HEADER = struct.Struct("<HI")
+_BIN_EXTRA_ROW = struct.Struct("<BHII")
+
+#CONCORDANCE.TXT -> CONCORDANCE.csv and so on; the text format keeps path.
+def format_path(path, fmt):
+    if fmt == "text":
+        return path
+    return os.path.splitext(path)[0] + _FORMAT_SUFFIX[fmt]
+
+def open_output(path, fmt):
+    if fmt == "binary":
+        return open(path, "wb", buffering=OUTPUT_BUFFER_SIZE)
+    return open(path, "w", encoding="utf-8", newline="", buffering=OUTPUT_BUFFER_SIZE)
+
+def _binary_concordance_record(word, positions):
+    raw = word.encode("utf-8")
+    flat = array("I")
+    for triple in positions:
+        flat.extend(triple)
+    if sys.byteorder == "big":
+        flat.byteswap()
+    return _BIN_WORD_HEADER.pack(len(raw), len(positions)) + raw + flat.tobytes()
+
+#Writes the three extra lists in one of the compact formats.
+#top_rows: [word, occurrences, files]; in_all: words; only_one: [word, file#]
+def write_extra_lists_format(path, fmt, top_rows, in_all, only_one):
+    rows = ([("top", w, occ, files, "") for w, occ, files in top_rows]
+            + [("all", w, "", "", "") for w in in_all]
+            + [("one", w, "", "", file_num) for w, file_num in only_one])
+    with open_output(path, fmt) as fh:
+        if fmt == "csv":
+            out = csv.writer(fh, lineterminator="\n")
+            out.writerow(["list", "word", "occurrences", "files", "file"])
+            out.writerows(rows)
+        elif fmt == "jsonl":
+            keys = ("occurrences", "files", "file")
+            for row in rows:
+                record = {"list": row[0], "word": row[1]}
+                record.update((k, v) for k, v in zip(keys, row[2:]) if v != "")
+                fh.write(json.dumps(record) + "\n")
+        elif fmt == "binary":
+            list_ids = {"top": 1, "all": 2, "one": 3}
+            fh.write(EXTRA_LISTS_BIN_MAGIC)
+            for name, word, occ, files, file_num in rows:
+                raw = word.encode("utf-8")
+                a, b = (occ, files) if name == "top" else (file_num or 0, 0)
+                fh.write(_BIN_EXTRA_ROW.pack(list_ids[name], len(raw), a, b) + raw)
 
 
 #This will print the concordance and transfer the text to the
 #CONCORDANCE.TXT file
 #Used this site as a resource: https://realpython.com/python-sort
 #Used this site as a resource: https://learnpython.com/blog/python-custom-sort-function
-def print_and_write_concordance(concordance):
-    sorted_words = sorted(concordance.keys(), key=sort_key)
-    out_lines = []
-
-    for word in sorted_words:
-        positions = []
-        for (file_num, line_num, word_num) in concordance[word]:
-            positions.append(f"{file_num}.{line_num}.{word_num}")
-        formatted_positions = "; ".join(positions) + "."
-        out_lines.append(f"{word} {formatted_positions}")
-
-    print("\nConcordance (also written to CONCORDANCE.TXT):")
-    for entry in out_lines:
-        print(entry)
-        
-    with open("CONCORDANCE.TXT", "w", encoding="utf-8") as f:
-        for entry in out_lines:
-            f.write(entry + "\n")
+#Entries are rendered and written CONCORDANCE_CHUNK at a time, so memory stays
+#bounded; a SpilledConcordance is streamed straight out of its merged runs.
+#formats picks the files to write (see OUTPUT_FORMATS); each one goes next to
+#path with its own extension. quiet=True skips the console echo.
+CONCORDANCE_CHUNK = 1000
+
+def render_concordance_entry(word, positions):
+    formatted_positions = "; ".join(f"{file_num}.{line_num}.{word_num}"
+                                    for (file_num, line_num, word_num) in positions) + "."
+    return f"{word} {formatted_positions}"
+
+def print_and_write_concordance(concordance, path="CONCORDANCE.TXT", quiet=False, formats=("text",)):
+    with profile_stage("concordance sort") as stage:
+        if hasattr(concordance, "iter_sorted"):
+            sorted_entries = concordance.iter_sorted()
+        else:
+            sorted_words = sorted(concordance.keys(), key=sort_key)
+            stage.add(len(sorted_words))
+            sorted_entries = ((word, concordance[word]) for word in sorted_words)
+
+    if not quiet:
+        print("\nConcordance (also written to CONCORDANCE.TXT):")
+    echo = not quiet
+    with ExitStack() as stack:
+        files = {fmt: stack.enter_context(open_output(format_path(path, fmt), fmt)) for fmt in formats}
+        if "binary" in files:
+            files["binary"].write(CONCORDANCE_BIN_MAGIC)
+        csv_out = csv.writer(files["csv"], lineterminator="\n") if "csv" in files else None
+        if csv_out:
+            csv_out.writerow(["word", "file", "line", "position"])
+        while True:
+            with profile_stage("render") as stage:
+                entries = [(word, list(positions)) for word, positions in islice(sorted_entries, CONCORDANCE_CHUNK)]
+                if not entries:
+                    break
+                if "text" in files or echo:
+                    text = "\n".join(render_concordance_entry(w, ps) for w, ps in entries) + "\n"
+                stage.add(len(entries))
+            with profile_stage("write") as stage:
+                if echo:
+                    sys.stdout.write(text)
+                for fmt, fh in files.items():
+                    if fmt == "text":
+                        fh.write(text)
+                    elif fmt == "csv":
+                        csv_out.writerows((w, f, ln, wn) for w, ps in entries for (f, ln, wn) in ps)
+                    elif fmt == "jsonl":
+                        fh.write("".join(json.dumps({"word": w, "positions": ps}) + "\n" for w, ps in entries))
+                    elif fmt == "binary":
+                        fh.write(b"".join(_binary_concordance_record(w, ps) for w, ps in entries))
+                stage.add(len(entries))
     
         
 #Part 3 of the project
-def word_in_every_file(file_list):
-    nonDistinct = None
-    for file in file_list:
-        with open(file, "r", encoding="utf-8") as f:
-            words = set(f.read().split())
-            if nonDistinct is None:
-                nonDistinct = words
-            else:
-                nonDistinct &= words
+#membership is the FileMembership from build_concordance, so the files do
+#not have to be read again.
+def word_in_every_file(membership):
+    nonDistinct = membership.in_all()
 
     print("\nWords in Every File (written to EXTRALISTS.TXT):")
-    for word in sorted(nonDistinct):
+    for word in sorted(nonDistinct, key=sort_key):
         print(word)
     
     with open("EXTRALISTS.TXT", "a", encoding="utf-8") as f:
         f.write("Words that Appear in Every File: \n")
-        for word in sorted(nonDistinct):
+        for word in sorted(nonDistinct, key=sort_key):
             f.write(word + "\n")
         f.write("\n")    
 #Part 4 of the project
-def distinct_list(file_list):
-    file_comp_count = Counter()
-    distinct_words = set()
-    for file in file_list:
-        with open(file, "r", encoding="utf-8") as f:
-            text = f.read()
-            words = set(match.group(0).lower() for match in WORD_RE.finditer(text))
-            distinct_words.update(words)
-            file_comp_count.update(words)
- 
-    unique = [word for word, count in file_comp_count.items() if count == 1]
+def distinct_list(membership):
+    unique = [word for word, _file_num in membership.only_one()]
     
     print("\nDistinct Words (written to EXTRALISTS.TXT):")
-    for word in sorted(unique):
-        print(unique)
+    for word in sorted(unique, key=sort_key):
+        print(word)
         
     with open("EXTRALISTS.TXT", "a", encoding="utf-8") as f:
         f.write("Distinct Words: \n")
-        for word in sorted(unique):
+        for word in sorted(unique, key=sort_key):
             f.write(word + "\n")
             
 #This will be to format the table accoridng to the SG2 specifications
@@ -344,82 +2109,915 @@ def align_table(rows, headers=None):
 
 
 #This will summarize where and how often each word appears across all the files
+#Returns (totals, FileMembership); a Concordance or SpilledConcordance already
+#has both, so then no postings are read at all.
 def file_stats(concordance, file_count):
-    totals = {}
-    filesets = {}
-    for w, positions in concordance.items():
-        totals[w] = len(positions)
-        filesets[w] = {f for (f, _ln, _wn) in positions}
-    return totals, filesets
+    if hasattr(concordance, "totals") and hasattr(concordance, "membership"):
+        totals = concordance.totals  # kept while the files were added
+    elif hasattr(concordance, "membership") and hasattr(concordance, "count"):
+        totals = {w: concordance.count(w) for w in concordance}
+    else:
+        totals = {w: len(positions) for w, positions in concordance.items()}
+    return totals, FileMembership.from_concordance(concordance)
 
 #This is used to sort the top ten words that user input from files
 def top_ten_sorting(word, totals):
     return (-totals[word], sort_key(word))  # negative total for descending
 
 #Printing the outputs to both the user and files
-def print_output(lines, sink): 
+def print_output(lines, sink, quiet=False): 
     for ln in lines:
-        print(ln)
+        if not quiet:
+            print(ln)
         sink.append(ln)
 
 #This function will buidl all three of the extra list and output them onto the
 #screen as well we to the ExtraList.txt
-def write_extra_lists(concordance, file_order):
-    file_count = len(file_order)
-    totals, filesets = file_stats(concordance, file_count)
-
-    all_words = list(concordance.keys())
-    all_words.sort(key=lambda w: top_ten_sorting(w, totals))
-    top10 = all_words[:10] if len(all_words) >= 10 else all_words
+#Returns the rows of the three extra lists:
+#  top_rows: [word, occurrences, files] for the n most frequent words
+#  in_all:   words found in every file, in concordance order
+#  only_one: [word, file number] for words found in a single file
+#A concordance that keeps these up to date itself (IncrementalConcordance)
+#is asked for them instead of walking every posting.
+def extra_lists(concordance, file_count, n=10):
+    if hasattr(concordance, "extra_lists"):
+        return concordance.extra_lists(n)
+    totals, membership = file_stats(concordance, file_count)
+
+    top10 = heapq.nsmallest(n, totals, key=lambda w: top_ten_sorting(w, totals))
 
     top_rows = []
     for w in top10:
-        top_rows.append([w, totals[w], len(filesets[w])])
+        top_rows.append([w, totals[w], membership.file_count(w)])
+
+    in_all = membership.in_all(file_count)
+    in_all.sort(key=sort_key)
+
+    only_one = [[w, file_num] for w, file_num in membership.only_one()]
+    only_one.sort(key=lambda row: sort_key(row[0]))
+    return top_rows, in_all, only_one
+
+def write_extra_lists(concordance, file_order, path="ExtraLists.txt", quiet=False, formats=("text",)):
+    file_count = len(file_order)
+    with profile_stage("extra lists") as stage:
+        top_rows, in_all, only_one = extra_lists(concordance, file_count)
+        stage.add(len(top_rows) + len(in_all) + len(only_one))
 
     top_header = ["Word", "Occurrences", "Files"]
     top_lines = []
-    print("\nTop Ten Words (by total occurrences):")
+    if not quiet:
+        print("\nTop Ten Words (by total occurrences):")
     formatted = align_table(top_rows, headers=top_header)
-    print_output(formatted, top_lines)
+    print_output(formatted, top_lines, quiet)
 
-    in_all = [w for w, s in filesets.items() if len(s) == file_count]
-    in_all.sort(key=sort_key)
     maxw = max([len("Word")] + [len(w) for w in in_all]) if in_all else len("Word")
     all_lines = []
-    print("\nWords that appear in ALL files:")
     header = f"{'Word':>{maxw}}"
-    print(header); all_lines.append(header)
-    print("-" * len(header)); all_lines.append("-" * len(header))
+    all_lines.append(header)
+    all_lines.append("-" * len(header))
     for w in in_all:
-        line = f"{w:>{maxw}}"
-        print(line); all_lines.append(line)
-
-    only_one = []
-    for w, s in filesets.items():
-        if len(s) == 1:
-            file_num = next(iter(s))
-            only_one.append([w, file_num])
-    only_one.sort(key=lambda row: sort_key(row[0]))
+        all_lines.append(f"{w:>{maxw}}")
+    if not quiet:
+        print("\nWords that appear in ALL files:")
+        print("\n".join(all_lines))
 
     single_lines = []
-    print("\nWords that appear in ONLY ONE file:")
+    if not quiet:
+        print("\nWords that appear in ONLY ONE file:")
     formatted_single = align_table(only_one, headers=["Word", "File#"])
-    print_output(formatted_single, single_lines)
+    print_output(formatted_single, single_lines, quiet)
+
+    with profile_stage("write") as stage:
+        stage.add(len(top_lines) + len(all_lines) + len(single_lines))
+        for fmt in formats:
+            if fmt != "text":
+                write_extra_lists_format(format_path(path, fmt), fmt, top_rows, in_all, only_one)
+                continue
+            with open_output(path, fmt) as fh:
+                fh.write("Top Ten Words (by total occurrences):\n")
+                fh.write("".join(ln + "\n" for ln in top_lines))
+                fh.write("\n")
+                fh.write("Words that appear in ALL files:\n")
+                fh.write("".join(ln + "\n" for ln in all_lines))
+                fh.write("\n")
+                fh.write("Words that appear in ONLY ONE file:\n")
+                fh.write("".join(ln + "\n" for ln in single_lines))
+
+
+# Phrase and proximity search
+# Queries run over the positional postings of a concordance:
+#   "first-base hit"   exact phrase (the words next to each other, also across
+#                      a line break)
+#   fox NEAR/3 dog     both words within 3 words of each other, either order
+# Every posting is turned into one integer key, file << 40 | word offset in
+# the file, so "next word" is key + 1. The rarest term drives the search and
+# the other terms are probed with galloping (exponential then binary) search,
+# so a query costs about (rarest postings) * log(other postings).
+# Building a searcher walks every posting once to learn how many words each
+# line holds; after that queries do not depend on the corpus size.
+
+_KEY_SHIFT = 40
+_KEY_MASK = (1 << _KEY_SHIFT) - 1
+_NEAR_QUERY_RE = re.compile(r"^\s*(\S+)\s+NEAR/(\d+)\s+(\S+)\s*$", re.IGNORECASE)
+
+#Parses a phrase or NEAR query into ("phrase", [words], 0) or
+#("near", [word, word], k). Returns None if it is not a legal query.
+def parse_query(text):
+    m = _NEAR_QUERY_RE.match(text)
+    if m:
+        first, k, second = m.groups()
+        if WORD_RE.fullmatch(first) and WORD_RE.fullmatch(second):
+            return ("near", [normalize_word(first), normalize_word(second)], int(k))
+        return None
+    terms = text.strip().strip('"').split()
+    if terms and all(WORD_RE.fullmatch(t) for t in terms):
+        return ("phrase", [normalize_word(t) for t in terms], 0)
+    return None
+
+#Smallest index >= lo with keys[index] >= target, found by doubling the step
+#from lo and then bisecting, so short skips stay cheap.
+def gallop(keys, target, lo=0):
+    n = len(keys)
+    if lo >= n or keys[lo] >= target:
+        return lo
+    bound = 1
+    while lo + bound < n and keys[lo + bound] < target:
+        bound *= 2
+    return bisect_left(keys, target, lo + bound // 2 + 1, min(lo + bound, n))
+
+#Sequence view of one word's postings as sorted integer keys. Keys are
+#computed on access, so probing it does not copy the postings.
+class _PostingKeys:
+
+    def __init__(self, flat, offsets):
+        self._flat = flat
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._flat) // 3
+
+    def __getitem__(self, i):
+        f, ln, wn = self._flat[3 * i:3 * i + 3]
+        return (f << _KEY_SHIFT) | (self._offsets[f][ln - 1] + wn - 1)
+
+class PhraseSearcher:
+
+    def __init__(self, concordance, file_list):
+        if not hasattr(concordance, "flat"):
+            raise TypeError("phrase search needs a concordance with random access")
+        self.concordance = concordance
+        self.file_list = file_list
+        self._offsets = self._line_offsets()
+
+    #Per file, the number of words before each line (index line - 1).
+    def _line_offsets(self):
+        line_words = {}
+        for word in self.concordance:
+            flat = self.concordance.flat(word)
+            for f, ln, wn in zip(flat[0::3], flat[1::3], flat[2::3]):
+                counts = line_words.setdefault(f, array("I"))
+                if len(counts) < ln:
+                    counts.extend([0] * (ln - len(counts)))
+                if wn > counts[ln - 1]:
+                    counts[ln - 1] = wn
+        offsets = {}
+        for f, counts in line_words.items():
+            offsets[f] = array("Q", accumulate(counts, initial=0))
+        return offsets
+
+    def _keys(self, word):
+        if word not in self.concordance:
+            return None
+        return _PostingKeys(self.concordance.flat(word), self._offsets)
+
+    #Start keys of every occurrence of the phrase.
+    def phrase(self, words):
+        keys = [self._keys(w) for w in words]
+        if any(k is None for k in keys):
+            return []
+        driver = min(range(len(words)), key=lambda i: len(keys[i]))
+        cursors = [0] * len(words)
+        hits = []
+        for i in range(len(keys[driver])):
+            key = keys[driver][i]
+            if key & _KEY_MASK < driver:
+                continue
+            start = key - driver
+            for j, other in enumerate(keys):
+                if j == driver:
+                    continue
+                cursors[j] = gallop(other, start + j, cursors[j])
+                if cursors[j] == len(other) or other[cursors[j]] != start + j:
+                    break
+            else:
+                hits.append(start)
+        return hits
+
+    #Keys of the earlier word of each match where the two words are at most
+    #k words apart (one match per occurrence of the rarer word). When both
+    #words are the same, an occurrence does not match itself.
+    def near(self, first, second, k):
+        keys = [self._keys(first), self._keys(second)]
+        if keys[0] is None or keys[1] is None:
+            return []
+        driver, other = sorted(keys, key=len)
+        same = first == second
+        cursor = 0
+        hits = []
+        for i in range(len(driver)):
+            key = driver[i]
+            file_base = key & ~_KEY_MASK
+            cursor = gallop(other, max(key - k, file_base), cursor)
+            j = cursor
+            if same and j < len(other) and other[j] == key:
+                j += 1
+            if j < len(other) and other[j] <= key + k and other[j] & ~_KEY_MASK == file_base:
+                hits.append(min(key, other[j]))
+        return sorted(set(hits))
+
+    #Turns a key back into the file.line.word notation used by the concordance.
+    def position(self, key):
+        f = key >> _KEY_SHIFT
+        offset = key & _KEY_MASK
+        offsets = self._offsets[f]
+        line = bisect_right(offsets, offset) - 1
+        return f"{f}.{line + 1}.{offset - offsets[line] + 1}"
+
+    #Runs a query string; returns ({filename: hit count}, [positions]).
+    def search(self, text):
+        query = parse_query(text)
+        if query is None:
+            raise ValueError(f"not a legal query: {text!r}")
+        with profile_stage("search") as stage:
+            kind, words, k = query
+            hits = self.phrase(words) if kind == "phrase" else self.near(words[0], words[1], k)
+            counts = {fname: 0 for fname in self.file_list}
+            for key in hits:
+                counts[self.file_list[(key >> _KEY_SHIFT) - 1]] += 1
+            stage.add(len(hits))
+        return counts, [self.position(key) for key in hits]
+
+def print_query_positions(positions):
+    if positions:
+        print("  at " + "; ".join(positions) + ".")
+        print()
+
+
+# Keyword in context
+# KWIC shows each hit of a word with a few words on either side, read straight
+# from the source file. Every file gets a table of the byte offset where each
+# line starts (one regex pass over the mapped file, the first time the file
+# is asked for), so the line of a posting is a slice of the memory map; only
+# that line and, if needed for more context, its neighbours are decoded.
+# Compressed files cannot be mapped and are decompressed into memory once.
+# The line breaks are those of str.splitlines, as UTF-8 bytes, so line
+# numbers agree with the tokenizer.
+KWIC_CONTEXT = 5
+_LINE_BREAK_BRE = re.compile(rb"\r\n|[\n\r\v\f\x1c\x1d\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]")
+_STEM_END_RE = re.compile(r"([A-Za-z]+)-\s*$")
+
+#Byte offset of the start of every line in buf, as array('Q').
+def line_offsets(buf):
+    starts = array("Q", [0])
+    size = len(buf)
+    for m in _LINE_BREAK_BRE.finditer(buf):
+        if m.end() < size:
+            starts.append(m.end())
+    return starts
+
+#True if split_lines drops the first word of line because it was joined to
+#the hyphenated last word of prev.
+def _drops_first_word(prev, line):
+    return (prev is not None and prev.rstrip().endswith("-") and bool(first_word(line))
+            and _STEM_END_RE.search(prev) is not None)
+
+class KwicIndex:
+
+    def __init__(self, files):
+        self.files = files    # file number - 1 -> filename (None if removed)
+        self._sources = {}    # file number -> (buffer, line starts)
+        self._stamps = {}     # file number -> (size, mtime) when it was mapped
+        self._closers = []
+
+    def _source(self, f):
+        source = self._sources.get(f)
+        if source is None:
+            file_name = self.files[f - 1]
+            opener = compressed_opener(file_name)
+            if opener is not None:
+                with opener(file_name, "rb") as fh:
+                    buf = fh.read()
+            else:
+                with open(file_name, "rb") as fh:
+                    st = os.fstat(fh.fileno())
+                    if st.st_size:
+                        buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                        self._closers.append(buf)
+                        self._stamps[f] = (st.st_size, st.st_mtime_ns)
+                    else:
+                        buf = b""
+            source = self._sources[f] = (buf, line_offsets(buf))
+        return source
+
+    #Drops mapped files that changed on disk since they were mapped; reading
+    #past the end of a file rewritten shorter would kill the process (SIGBUS).
+    def _revalidate(self):
+        for f, stamp in list(self._stamps.items()):
+            try:
+                st = os.stat(self.files[f - 1])
+                current = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                current = None
+            if current != stamp:
+                del self._stamps[f]
+                buf, _starts = self._sources.pop(f)
+                self._closers.remove(buf)
+                buf.close()
+
+    #Text of line ln (1-based) of file f without its line break, or None.
+    def _line(self, f, ln):
+        buf, starts = self._source(f)
+        if ln < 1 or ln > len(starts):
+            return None
+        end = starts[ln] if ln < len(starts) else len(buf)
+        lines = buf[starts[ln - 1]:end].decode("utf-8", errors="replace").splitlines()
+        return lines[0] if lines else ""
+
+    def _words(self, f, ln):
+        return WORD_RE.findall(self._line(f, ln) or "")
+
+    #Returns (left context, hit, right context) for the posting (f, ln, wn) of
+    #word, with up to `context` words on each side.
+    def snippet(self, f, ln, wn, word, context=KWIC_CONTEXT):
+        line = self._line(f, ln)
+        matches = WORD_RE.findall(line or "")
+        i = wn - 1 + (1 if _drops_first_word(self._line(f, ln - 1), line or "") else 0)
+        if not (i < len(matches) and word.startswith(matches[i].lower())):
+            # fall back to the nearest occurrence if the join rule was not met
+            near = [j for j in (wn - 1, wn) if j < len(matches) and word.startswith(matches[j].lower())]
+            i = near[0] if near else min(wn - 1, max(len(matches) - 1, 0))
+        hit = matches[i] if matches else word
+        joined = hit.lower() != word
+        if joined:
+            hit = word  # joined across a line break; show the joined word
+
+        before = matches[:i]
+        prev = ln - 1
+        while len(before) < context and prev >= 1:
+            before = self._words(f, prev) + before
+            prev -= 1
+        after = matches[i + 1:]
+        nxt = ln + 1
+        while len(after) < context and self._line(f, nxt) is not None:
+            # the first word of the next line is already part of a joined hit
+            after = after + self._words(f, nxt)[1 if joined and nxt == ln + 1 else 0:]
+            nxt += 1
+        left = " ".join(before[len(before) - context:]) if context else ""
+        right = " ".join(after[:context])
+        return left, hit, right
+
+    #(file, line, word number, left, hit, right) for the hits of word in
+    #concordance, at most limit of them.
+    def lookup(self, concordance, word, context=KWIC_CONTEXT, limit=None):
+        word = normalize_word(word)
+        if word not in concordance:
+            return []
+        self._revalidate()
+        with profile_stage("kwic") as stage:
+            rows = [(f, ln, wn) + self.snippet(f, ln, wn, word, context)
+                    for f, ln, wn in islice(concordance[word], limit)]
+            stage.add(len(rows))
+        return rows
+
+    def close(self):
+        self._sources.clear()
+        self._stamps.clear()
+        for mm in self._closers:
+            mm.close()
+        self._closers.clear()
+
+def print_kwic(word, rows):
+    print(f"\n{word} in context:")
+    if not rows:
+        print("  no hits.")
+        return
+    width = max(len(row[3]) for row in rows)
+    for f, ln, wn, left, hit, right in rows:
+        print(f"  {f}.{ln}.{wn}  {left:>{width}} [{hit}] {right}")
+
+
+# Approximate statistics
+# For a quick profile of a very large corpus these fixed-size sketches
+# replace the exact per-file word sets and the full vocabulary sort.
+
+#Stable 64-bit hash of a word (Python's hash() changes between runs).
+def _hash64(word):
+    return int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-count sketch with 2**precision one-byte registers.
+    Memory is fixed at 2**precision bytes (16 KiB at the default 14).
+    The relative standard error is about 1.04 / sqrt(2**precision),
+    i.e. ~0.8% at precision 14; small counts use linear counting and are
+    close to exact.
+    """
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise ValueError("precision must be between 4 and 18")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, word):
+        h = _hash64(word)
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        #Union with another sketch of the same precision.
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitters sketch that monitors at most `capacity` words.
+    Memory is fixed by capacity. After N words, every reported count is at most
+    N / capacity above the true count (count - error is a guaranteed lower
+    bound), and any word occurring more than N / capacity times is monitored.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.total = 0
+        self.counts = {}
+        self.errors = {}
+        self._heap = []  # (count, word); entries can be stale, checked on eviction
+
+    def add(self, word):
+        self.total += 1
+        if word in self.counts:
+            self.counts[word] += 1
+            return
+        error = 0
+        if len(self.counts) >= self.capacity:
+            while True:
+                count, victim = heapq.heappop(self._heap)
+                if self.counts[victim] == count:
+                    break
+                heapq.heappush(self._heap, (self.counts[victim], victim))
+            del self.counts[victim]
+            del self.errors[victim]
+            error = count
+        self.counts[word] = error + 1
+        self.errors[word] = error
+        heapq.heappush(self._heap, (error + 1, word))
+
+    def copy(self):
+        other = SpaceSaving(self.capacity)
+        other.total = self.total
+        other.counts = dict(self.counts)
+        other.errors = dict(self.errors)
+        other._heap = list(self._heap)
+        return other
+
+    def top(self, n):
+        #Returns up to n (word, estimated count, max overcount), largest first.
+        words = sorted(self.counts, key=lambda w: (-self.counts[w], sort_key(w)))[:n]
+        return [(w, self.counts[w], self.errors[w]) for w in words]
+
+#Streams every file once through fixed-size sketches.
+#Returns (rows, top, overall) where rows are (filename, total, estimated distinct),
+#top is SpaceSaving.top(top_n) over all files and overall is the estimated
+#number of distinct words in the whole corpus.
+#When a skipped list is given, files failing with FILE_ERRORS are appended to
+#it as (filename, error) and left out of the rows and sketches.
+def approximate_profile(file_list, top_n=10, precision=14, capacity=None, skipped=None):
+    heavy = SpaceSaving(capacity or max(1000, 100 * top_n))
+    union = HyperLogLog(precision)
+    rows = []
+    for filename in file_list:
+        sketch = HyperLogLog(precision)
+        before = heavy.copy()  # the file may fail part way through
+        total = 0
+        try:
+            for word, _line_number, _word_number in tokenize_file(filename):
+                total += 1
+                sketch.add(word)
+                heavy.add(word)
+        except FILE_ERRORS as e:
+            if skipped is None:
+                raise
+            skipped.append((filename, e))
+            heavy = before
+            continue
+        union.merge(sketch)
+        rows.append((filename, total, sketch.estimate()))
+    return rows, heavy.top(top_n), union.estimate()
+
+#Runs approximate_profile and prints it, reporting files that could not be
+#read. Returns False if none could.
+def report_approximate_profile(file_list, top_n=10):
+    skipped = []
+    rows, top, overall = approximate_profile(file_list, top_n, skipped=skipped)
+    for filename, error in skipped:
+        print(f"Skipping '{filename}': {error}")
+    if not rows:
+        print("None of the files could be read.")
+        return False
+    print_approximate_profile(rows, top, overall)
+    return True
+
+def print_approximate_profile(rows, top, overall):
+    print_summary_rows([(fname, total, f"~{distinct}") for fname, total, distinct in rows])
+    print(f"Estimated distinct words across all files: ~{overall}")
+    print(f"\nTop {len(top)} Words (approximate):")
+    for ln in align_table(top, headers=["Word", "~Occurrences", "MaxOvercount"]):
+        print(ln)
 
-    with open("ExtraLists.txt", "w", encoding="utf-8") as fh:
-        fh.write("Top Ten Words (by total occurrences):\n")
-        for ln in top_lines: fh.write(ln + "\n")
-        fh.write("\n")
-        fh.write("Words that appear in ALL files:\n")
-        for ln in all_lines: fh.write(ln + "\n")
-        fh.write("\n")
-        fh.write("Words that appear in ONLY ONE file:\n")
-        for ln in single_lines: fh.write(ln + "\n")
+
+# Query server
+# --serve keeps the files indexed in memory and answers queries from other
+# local programs, one JSON object per line in each direction over TCP:
+#   {"op": "count", "word": "fox"}         {"ok": true, "counts": {file: n}, "total": n}
+#       (word may be a wildcard pattern; the matched words come back as "matches")
+#   {"op": "concordance", "word": "fox"}   {"ok": true, "positions": [[file, line, word], ...]}
+#   {"op": "extra", "n": 10}               {"ok": true, "top": [[word, occurrences, files], ...],
+#                                           "all": [word, ...], "one": [[word, file], ...]}
+#   {"op": "kwic", "word": "fox",          {"ok": true, "hits": [[file, line, word,
+#    "context": 5, "limit": 100}             left, hit, right], ...]}
+#   {"op": "files"}                        {"ok": true, "files": [[number, filename], ...]}
+#   {"op": "reload"}                       {"ok": true, "added": [...], "modified": [...], "removed": [...]}
+# Errors come back as {"ok": false, "error": "..."}. Many clients can be
+# connected at once. A reload expands the file arguments again and brings the
+# index up to date (see IncrementalConcordance): files are stat'ed, hashed and
+# parsed on a worker thread while queries keep being answered, and only the
+# final merge of the changed files runs on the event loop.
+SERVE_HOST = "127.0.0.1"
+
+#True for a non-negative JSON integer; bool is an int in Python, so
+#true/false are turned away explicitly.
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+class QueryServer:
+
+    def __init__(self, patterns, manifest=None, workers=None, read_ahead=None):
+        self.patterns = patterns
+        self.manifest = manifest
+        self.workers = workers
+        self.read_ahead = read_ahead
+        self.concordance = IncrementalConcordance()
+        self.generation = 0
+        self._cache = {}  # per generation: extra lists, term dictionary
+        self._reload_lock = None
+
+    #Indexes the files; returns (indexed filenames, [(filename, error)] for
+    #the files that could not be read).
+    def load(self):
+        skipped = []
+        file_list = expand_file_args(self.patterns, self.manifest)
+        self.concordance.apply(file_list, self.workers, self.read_ahead, skipped)
+        return self.concordance.file_list, skipped
+
+    async def reload(self):
+        async with self._reload_lock:
+            loop = asyncio.get_running_loop()
+            conc = self.concordance
+
+            # stat, hash and parse off the event loop; only reads the index
+            def prepare():
+                changes = conc.changes(expand_file_args(self.patterns, self.manifest), skipped)
+                added, modified, _removed, _fingerprints = changes
+                return changes, list(iter_file_postings(modified + added, self.workers, self.read_ahead,
+                                                        errors=True))
+
+            skipped = []
+            changes, postings = await loop.run_in_executor(None, prepare)
+            conc.apply_changes(changes, postings, skipped)
+            self.generation += 1
+            kwic = self._cache.get("kwic")
+            self._cache.clear()
+            if kwic is not None:
+                kwic.close()
+            added, modified, removed, _fingerprints = changes
+            failed = {name for name, _error in skipped}
+            return {"ok": True, "added": [name for name in added if name not in failed],
+                    "modified": [name for name in modified if name not in failed],
+                    "removed": removed + [name for name in modified if name in failed],
+                    "skipped": [[name, str(error)] for name, error in skipped]}
+
+    def _cached(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def _word(self, request):
+        word = request.get("word")
+        if not isinstance(word, str) or not (WORD_RE.fullmatch(word) or is_wildcard_query(word)):
+            raise ValueError("'word' must be a legal word or wildcard pattern")
+        return word
+
+    #Answers one request (anything but reload) from the in-memory index.
+    def query(self, request):
+        op = request.get("op")
+        conc = self.concordance
+        if op == "count":
+            word = self._word(request)
+            if is_wildcard_query(word):
+                terms = self._cached("terms", lambda: TermDictionary(conc))
+                matches = terms.expand(word)
+                counts = Counter()
+                for match in matches:
+                    counts.update(conc.file_counts(match))
+                counts = {name: counts[name] for name in conc.file_list if name in counts}
+                return {"ok": True, "word": word, "counts": counts,
+                        "total": sum(counts.values()), "matches": matches}
+            counts = conc.file_counts(normalize_word(word))
+            return {"ok": True, "word": word, "counts": counts, "total": sum(counts.values())}
+        if op == "concordance":
+            word = normalize_word(self._word(request))
+            positions = conc[word] if word in conc else []
+            return {"ok": True, "word": word, "positions": positions}
+        if op == "extra":
+            n = request.get("n", 10)
+            if not _is_count(n):
+                raise ValueError("'n' must be a non-negative integer")
+            top_rows, in_all, only_one = self._cached(("extra", n), lambda: conc.extra_lists(n))
+            return {"ok": True, "top": top_rows, "all": in_all, "one": only_one}
+        if op == "kwic":
+            word = self._word(request)
+            if not WORD_RE.fullmatch(word):
+                raise ValueError("'word' must be a legal word")
+            context = request.get("context", KWIC_CONTEXT)
+            limit = request.get("limit")
+            if not _is_count(context) or not (limit is None or _is_count(limit)):
+                raise ValueError("'context' and 'limit' must be non-negative integers")
+            kwic = self._cached("kwic", lambda: KwicIndex(conc.files))
+            return {"ok": True, "word": word, "hits": kwic.lookup(conc, word, context, limit)}
+        if op == "files":
+            return {"ok": True, "files": [[conc.file_number(name), name] for name in conc.file_list]}
+        raise ValueError(f"unknown op {op!r}")
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                    if request.get("op") == "reload":
+                        response = await self.reload()
+                    else:
+                        with profile_stage("serve") as stage:
+                            response = self.query(request)
+                            stage.add()
+                except (ValueError, *FILE_ERRORS) as e:
+                    response = {"ok": False, "error": str(e)}
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=SERVE_HOST, port=0, ready=None):
+        self._reload_lock = asyncio.Lock()
+        server = await asyncio.start_server(self.handle_client, host, port)
+        if ready is not None:
+            ready(server.sockets[0].getsockname())
+        async with server:
+            await server.serve_forever()
+
+#Parses "PORT" or "HOST:PORT" for --serve.
+def parse_serve_address(text):
+    host, _sep, port = text.rpartition(":")
+    return host or SERVE_HOST, int(port)
+
+def run_server(args):
+    host, port = parse_serve_address(args.serve)
+    server = QueryServer(args.files, args.manifest, args.workers, args.read_ahead)
+    file_list, skipped = server.load()
+    for filename, error in skipped:
+        print(f"Skipping '{filename}': {error}")
+    if not file_list:
+        print("None of the files could be read." if skipped else "No valid .txt files were given.")
+        return 1
+
+    def ready(address):
+        print(f"Serving {len(file_list)} files ({len(server.concordance)} words) "
+              f"on {address[0]}:{address[1]}; press Ctrl-C to stop.", flush=True)
+
+    try:
+        asyncio.run(server.serve(host, port, ready))
+    except KeyboardInterrupt:
+        print("Server stopped.")
+    return 0
 
 
 # Main Program Logic
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="SG2: Word count, Search, Concordance, and Extra Lists",
+        epilog="With no FILE or --manifest the program runs interactively and prompts for everything.")
+    parser.add_argument("files", nargs="*", metavar="FILE",
+                        help=".txt files (also .txt.gz/.txt.bz2/.txt.xz) or glob patterns "
+                             "to process without prompting")
+    parser.add_argument("--manifest", metavar="FILE",
+                        help="file listing one .txt path or glob pattern per line ('#' starts a comment)")
+    parser.add_argument("--output-dir", metavar="DIR", default=".",
+                        help="where CONCORDANCE.TXT, ExtraLists.txt and the index are written (batch mode)")
+    parser.add_argument("--workers", metavar="N", type=int,
+                        help="tokenize files in N worker processes (batch mode)")
+    parser.add_argument("--read-ahead", metavar="N", type=int,
+                        help="read up to N files concurrently while earlier ones are tokenized "
+                             "(useful on network or spinning storage)")
+    parser.add_argument("--serve", metavar="[HOST:]PORT",
+                        help="keep the files indexed in memory and answer JSON-lines queries "
+                             "on HOST:PORT (default host 127.0.0.1) until stopped")
+    parser.add_argument("--queries", metavar="FILE",
+                        help="search every word in FILE ('-' for stdin) instead of prompting for words")
+    parser.add_argument("--phrase", dest="phrases", metavar="QUERY", action="append",
+                        help="phrase ('\"first-base hit\"') or proximity ('fox NEAR/3 dog') query "
+                             "to run in batch mode; repeat for several")
+    parser.add_argument("--kwic", metavar="WORD", action="append",
+                        help="show every hit of WORD with the words around it (batch mode); "
+                             "repeat for several words")
+    parser.add_argument("--context", metavar="N", type=int, default=KWIC_CONTEXT,
+                        help=f"words of context on each side for --kwic (default {KWIC_CONTEXT})")
+    parser.add_argument("--memory-budget", metavar="MB", type=int,
+                        help="sort the concordance on disk once it needs more than MB megabytes")
+    parser.add_argument("--approximate", action="store_true",
+                        help="only print a quick profile using fixed-size sketches "
+                             "(estimated distinct words and top words)")
+    parser.add_argument("--top-n", metavar="N", type=int, default=10,
+                        help="number of top words in the approximate profile (default 10)")
+    parser.add_argument("--quiet", action="store_true",
+                        help="do not echo the concordance and extra lists to the console")
+    parser.add_argument("--format", dest="formats", action="append", choices=OUTPUT_FORMATS,
+                        help="output format for the concordance and extra lists; repeat for several "
+                             "(default text)")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="record per-stage wall/CPU time, item counts and peak memory "
+                             "and write them to FILE as JSON")
+    return parser.parse_args(argv)
+
+#Expands file arguments and manifest entries (globs allowed) into the list of
+#files to process, keeping the given order and dropping duplicates.
+#Entries that are not existing .txt files are reported and skipped.
+def expand_file_args(patterns, manifest=None):
+    patterns = list(patterns)
+    if manifest:
+        with open(manifest, "r", encoding="utf-8") as f:
+            for line in f:
+                entry = line.split("#", 1)[0].strip()
+                if entry:
+                    patterns.append(entry)
+
+    file_list = []
+    seen = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                print(f"No files match '{pattern}'.")
+        else:
+            matches = [pattern]
+        for fname in matches:
+            if fname in seen:
+                continue
+            seen.add(fname)
+            if not is_txt_filename(fname):
+                print(f"Skipping '{fname}': filename must end with .TXT (or .TXT.GZ/.BZ2/.XZ).")
+            elif not os.path.isfile(fname):
+                print(f"Skipping '{fname}': file not found.")
+            else:
+                file_list.append(fname)
+    return file_list
+
+#Per-file word counts (filename -> Counter) recovered from a concordance,
+#for the summary table and the search stage in batch mode.
+def word_counts_from_concordance(concordance, file_list):
+    counts = [Counter() for _ in file_list]
+    for word, positions in concordance.items():
+        for file_num, _ln, _wn in positions:
+            counts[file_num - 1][word] += 1
+    return dict(zip(file_list, counts))
+
+#Non-interactive run over any number of files: summary, optional query list,
+#concordance and extra lists, with no prompts. Returns a process exit code.
+def run_batch(args):
+    file_list = expand_file_args(args.files, args.manifest)
+    if not file_list:
+        print("No valid .txt files were given.")
+        return 1
+
+    if args.approximate:
+        return 0 if report_approximate_profile(file_list, args.top_n) else 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    skipped = []  # (filename, error) for files that could not be read
+    if args.memory_budget:
+        concordance, _membership = build_concordance(file_list, workers=args.workers,
+                                                     memory_budget=args.memory_budget * 1024 * 1024,
+                                                     read_ahead=args.read_ahead, skipped=skipped)
+    else:
+        concordance = load_or_build_concordance(file_list, os.path.join(args.output_dir, INDEX_FILE),
+                                                workers=args.workers, read_ahead=args.read_ahead,
+                                                skipped=skipped)
+    if skipped:
+        for filename, error in skipped:
+            print(f"Skipping '{filename}': {error}")
+        bad = {filename for filename, _error in skipped}
+        file_list = [filename for filename in file_list if filename not in bad]
+        if not file_list:
+            print("None of the files could be read.")
+            return 1
+
+    index = concordance if isinstance(concordance, ConcordanceIndex) else None
+    word_data = None
+    if hasattr(concordance, "file_stats"):
+        # a reopened index or a spilled concordance: the summary is already known
+        print_summary_rows([(fname, total, distinct)
+                            for fname, (total, distinct) in zip(file_list, concordance.file_stats())])
+    else:
+        word_data = word_counts_from_concordance(concordance, file_list)
+        print_file_summary(file_list, word_data)
+    search_history = []
+    if args.queries:
+        if index is None and word_data is None:
+            word_data = word_counts_from_concordance(concordance, file_list)
+        search_history = batch_search(read_query_words(args.queries), file_list, word_data, index)
+    if args.phrases and args.memory_budget:
+        print("Phrase and NEAR searches are not available with --memory-budget.")
+    elif args.phrases:
+        phrase_searcher = PhraseSearcher(concordance, file_list)
+        for text in args.phrases:
+            if parse_query(text) is None:
+                print(f"Skipping invalid query '{text}'.")
+                continue
+            results, positions = phrase_searcher.search(text)
+            if not args.quiet:
+                print(f"\n{text}:")
+                print_query_positions(positions)
+            search_history.append((text, results))
+    if search_history:
+        print_search_history_summary(search_history, file_list)
+    if args.kwic and args.memory_budget:
+        print("Keyword-in-context lookups are not available with --memory-budget.")
+    elif args.kwic:
+        kwic = KwicIndex(file_list)
+        try:
+            for word in args.kwic:
+                if not WORD_RE.fullmatch(word):
+                    print(f"Skipping invalid word '{word}'.")
+                    continue
+                print_kwic(word, kwic.lookup(concordance, word, args.context))
+        finally:
+            kwic.close()
+
+    formats = args.formats or ["text"]
+    print_and_write_concordance(concordance, os.path.join(args.output_dir, "CONCORDANCE.TXT"),
+                                quiet=args.quiet, formats=formats)
+    write_extra_lists(concordance, file_list, os.path.join(args.output_dir, "ExtraLists.txt"),
+                      quiet=args.quiet, formats=formats)
+    if args.memory_budget:
+        concordance.close()
+    return 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.profile:
+        enable_profiling()
+    try:
+        if args.serve:
+            if not (args.files or args.manifest):
+                print("--serve needs files or a --manifest.")
+                return 1
+            return run_server(args)
+        if args.files or args.manifest:
+            return run_batch(args)
+        return run_interactive(args)
+    finally:
+        if args.profile:
+            disable_profiling().write_report(args.profile)
+
+def run_interactive(args):
     intro = ( #updated the intro for the SG2
         "SG2: Word count, Search, Concordance, and Extra Lists\n"
         "This program reads up to 10 text files (.TXT), parses words (letters and optional internal hyphens),\n"
@@ -436,19 +3034,58 @@ def main():
     print(intro)
     # Containers
     # file_list: list to store filenames in the order they were entered
-    # word_data: dictionary that maps filename -> list of all words extracted from that file
+    # word_data: dictionary that maps filename -> Counter of the words in that file,
+    #   so a search is one dictionary lookup per file
+    # concordance: compact word -> (file, line, word) positions, filled while loading
     file_list = []
-    word_data = {}  # filename -> list of words (original order)
+    word_data = {}  # filename -> Counter of lowercased words
+    if args.memory_budget:
+        concordance = SpilledConcordance(args.memory_budget * 1024 * 1024)
+    else:
+        concordance = Concordance()
     MAX_FILES = 10
+    # With --read-ahead the files are read in the background as they are
+    # entered and tokenized (in the order entered) once the list is complete
+    loader = FileLoader(args.read_ahead) if args.read_ahead and args.read_ahead > 1 and not args.approximate else None
+    queued = []  # filenames handed to the loader, not loaded yet
+
+    #Reads and tokenizes one file once; the same pass feeds the word counts
+    #used for the summary and search and the concordance positions.
+    #data holds the file's bytes when the loader already read it.
+    #A file that fails part way is rolled back out of the concordance,
+    #so its number goes to the next file that loads.
+    def load_file(fname, data=None):
+        file_index = len(file_list) + 1
+        words = Counter()
+        concordance.checkpoint(file_index)
+        try:
+            with profile_stage("index") as stage:
+                for word, line_number, word_number in tokenize_file(fname, data):
+                    words[word] += 1
+                    concordance.add(word, file_index, line_number, word_number)
+                stage.add(sum(words.values()))
+        except Exception as e:
+            concordance.rollback()
+            print(f"Error opening file '{fname}': {e}")
+            return
+        if args.memory_budget:
+            concordance.record_file(file_index, words)
+
+        # Store
+        # word_data dictionary stores the word counts for this filename
+        word_data[fname] = words
+        file_list.append(fname)
+        print(f"Loaded '{fname}' with {sum(words.values())} words ({len(words)} distinct).")
 
     #  File input loop 
-    while len(file_list) < MAX_FILES:
+    while len(file_list) + len(queued) < MAX_FILES:
         raw_fname = prompt_input("Enter a .TXT filename (in same directory as this script): ").strip() #get filename
         if not is_txt_filename(raw_fname):
-            print("Filename must end with .TXT (case-insensitive). Please try again.")
+            print("Filename must end with .TXT, optionally compressed as .TXT.GZ/.BZ2/.XZ "
+                  "(case-insensitive). Please try again.")
             continue
         # Check duplicate
-        if raw_fname in file_list:
+        if raw_fname in file_list or raw_fname in queued:
             print("You already entered that filename. Enter a different filename or say No to add more files.")
             add_more = prompt_yes_no("Add another file? (Yes/No): ")
             if add_more:
@@ -459,26 +3096,22 @@ def main():
         if not os.path.isfile(raw_fname):
             print(f"File '{raw_fname}' not found in current directory ({os.getcwd()}). Please try again.")
             continue
-        # Try opening and parsing
-        try:
-            with open(raw_fname, 'r', encoding='utf-8') as f:
-                lines = f.readlines() # Read all lines into a list
-        except Exception as e:
-            print(f"Error opening file '{raw_fname}': {e}")
-            continue
-
-        # Preprocess lines to handle line-break hyphen rules
-        combined_text = parse_text_handling_line_hyphens(lines)
-        # Extract valid words from the processed text
-        words = extract_words_from_text(combined_text)
-        # Store
-        # word_data dictionary stores the list of words for this filename
-        word_data[raw_fname] = words
-        file_list.append(raw_fname)
-        print(f"Loaded '{raw_fname}' with {len(words)} words ({len(set(normalize_word(w) for w in words))} distinct).")
+        if args.approximate:
+            # the profile streams the files later, so just record the name
+            file_list.append(raw_fname)
+            print(f"Added '{raw_fname}'.")
+            if len(file_list) < MAX_FILES and prompt_yes_no("Add another file? (Yes/No): "):
+                continue
+            break
+        if loader is not None:
+            loader.submit(raw_fname)
+            queued.append(raw_fname)
+            print(f"Queued '{raw_fname}'.")
+        else:
+            load_file(raw_fname)
 
         # If reached max files, stop asking
-        if len(file_list) >= MAX_FILES:
+        if len(file_list) + len(queued) >= MAX_FILES:
             print(f"Reached maximum of {MAX_FILES} files.")
             break
 
@@ -487,25 +3120,48 @@ def main():
         if not add_more:
             break
 
+    if loader is not None:
+        with loader:
+            for fname, future in loader:
+                try:
+                    data = future.result()
+                except FILE_ERRORS as e:
+                    print(f"Error opening file '{fname}': {e}")
+                    continue
+                load_file(fname, data)
+
     if not file_list:
         print("No files were entered. Program will exit.")
         return
 
+    if args.approximate:
+        report_approximate_profile(file_list, args.top_n)
+        prompt_input("Program finished. Press ENTER to exit.")
+        print("Goodbye.")
+        return
+
     #  Print file summary 
     print_file_summary(file_list, word_data)
 
     #  Word search loop 
     search_history = [] # Stores search queries and results for final summary
-    while True:
+    phrase_searcher = None # built on the first phrase/NEAR query
+    term_dictionary = None # built on the first wildcard pattern
+    if args.queries:
+        # Batch mode: look up the whole query list and go straight to the summary
+        search_history = batch_search(read_query_words(args.queries), file_list, word_data)
+    while not args.queries:
         # Prompt for LegalWord
         # LegalCharacters = 'abcdefghijklmnopqrstuvwxyz-'
         while True:
-            candidate = prompt_input("Enter a word to search (letters and hyphen allowed): ").strip() 
+            candidate = prompt_input("Enter a word to search (letters and hyphen allowed, "
+                                     "or \"a phrase\" / word NEAR/3 word): ").strip() 
             if candidate == "":
                 print("Empty input not allowed; please enter a legal word.")
                 continue
             # Validate: must match pattern ^[A-Za-z]+(?:-[A-Za-z]+)*$
-            if WORD_RE.fullmatch(candidate):
+            # or be a phrase / NEAR query made of legal words
+            if WORD_RE.fullmatch(candidate) or is_wildcard_query(candidate) or parse_query(candidate):
                 legal_word = candidate # the legal word to search
                 break
             else:
@@ -513,16 +3169,28 @@ def main():
                 print("Invalid word. A legal word contains only letters and internal hyphen(s) (e.g., 'first-base').")
                 print("Please try again.")
 
-        # Count occurrences in each file
-        lw_norm = normalize_word(legal_word) 
-        results = {} # Dictionary to store filename
-        for fname in file_list:
-            words = word_data[fname] # Get the word list for this file
-            cnt = sum(1 for w in words if normalize_word(w) == lw_norm)  # Count occurrences
-            results[fname] = cnt # Store count
+        if WORD_RE.fullmatch(legal_word):
+            # Count occurrences in each file (one lookup per file)
+            results = count_word(legal_word, file_list, word_data)
+            details = None
+        elif is_wildcard_query(legal_word):
+            if term_dictionary is None:
+                term_dictionary = TermDictionary.from_word_data(word_data)
+            results, matches = count_pattern(legal_word, term_dictionary, file_list, word_data)
+            details = lambda: print_pattern_matches(matches)
+        elif args.memory_budget:
+            print("Phrase and NEAR searches are not available with --memory-budget.")
+            continue
+        else:
+            if phrase_searcher is None:
+                phrase_searcher = PhraseSearcher(concordance, file_list)
+            results, positions = phrase_searcher.search(legal_word)
+            details = lambda: print_query_positions(positions)
 
         # Display results
         print_search_results_for_word(legal_word, results)
+        if details:
+            details()
         # Record in history
         search_history.append((legal_word, results))
 
@@ -534,13 +3202,15 @@ def main():
     # Final summary
     print_search_history_summary(search_history, file_list)
 
-    concordance, files_word_sets = build_concordance(file_list)              
-    print_and_write_concordance(concordance)
-    write_extra_lists(concordance, file_list)
+    formats = args.formats or ["text"]
+    print_and_write_concordance(concordance, quiet=args.quiet, formats=formats)
+    write_extra_lists(concordance, file_list, quiet=args.quiet, formats=formats)
+    if args.memory_budget:
+        concordance.close()
     
     # Finish
     prompt_input("Program finished. Press ENTER to exit.")
     print("Goodbye.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
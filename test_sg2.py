@@ -0,0 +1,307 @@
+#Language: Python 3
+#Purpose: Regression tests for SG2.
+#Run with: python -m pytest -q
+
+
+import io
+import os
+import re
+import random
+
+import pytest
+
+import sg2
+
+
+# Tokenizer
+# The streaming tokenizers (mapped ASCII blocks, chunked text) must give the
+# same lines and words as the original whole-file split_file, kept here as the
+# reference.
+
+def reference_split_file(file_name):
+    with open(file_name, "r", encoding="utf-8") as file:
+        lines = file.read().splitlines()
+    words_per_line = []
+    drop_first_next = False
+    for i, line_text in enumerate(lines):
+        words_here = [w.lower() for w in sg2.WORD_RE.findall(line_text)]
+        if drop_first_next and words_here:
+            words_here = words_here[1:]
+            drop_first_next = False
+        if line_text.rstrip().endswith("-") and i + 1 < len(lines):
+            next_first = sg2.first_word(lines[i + 1])
+            if next_first:
+                m = re.search(r"([A-Za-z]+)-\s*$", line_text)
+                if m:
+                    stem = m.group(1).lower()
+                    merged = stem + next_first
+                    if words_here and words_here[-1].startswith(stem):
+                        words_here[-1] = merged
+                    else:
+                        words_here.append(merged)
+                    drop_first_next = True
+        words_per_line.append(words_here)
+    return words_per_line
+
+PIECES = ["fox", "Dog", "a", "first-base", "well-", "-", "--", " ", "  ", "\t", ",", "'s", "42",
+          "\n", "\n", "\r\n", "\r", "-\n", "- \n", "-\r\n", "\f", "\x1c", "\x0b", "\u00e9t\u00e9", "na\u00efve-"]
+
+# the pieces the mapped ASCII path accepts
+ASCII_PIECES = [p for p in PIECES if p.isascii() and p not in ("\r", "\f", "\x1c", "\x0b")]
+
+def random_text(rng, pieces):
+    return "".join(rng.choice(pieces) for _ in range(rng.randint(0, 60)))
+
+def words_only(lines):
+    return [words_here for _line_number, words_here in lines]
+
+def test_streaming_tokenizers_match_split_file(tmp_path):
+    rng = random.Random(2024)
+    path = tmp_path / "fuzz.txt"
+    for n in range(400):
+        data = random_text(rng, ASCII_PIECES if n % 2 else PIECES).encode("utf-8")
+        path.write_bytes(data)
+        expected = reference_split_file(path)
+
+        assert words_only(sg2.split_file_lines(str(path))) == expected
+        assert words_only(sg2.split_file_lines(str(path), data)) == expected
+        for chunk_size in (1, 2, 3, 7, 64):
+            with open(path, "r", encoding="utf-8") as file:
+                assert words_only(sg2.split_lines(sg2.iter_text_lines(file, chunk_size))) == expected
+            file = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8")
+            assert words_only(sg2.split_lines(sg2.iter_text_lines(file, chunk_size))) == expected
+        if data and sg2._ascii_safe(data):
+            for block_size in (1, 2, 3, 7, 64):
+                assert words_only(sg2.split_ascii_buffer(data, block_size)) == expected
+
+
+# Phrase and proximity search
+
+def make_searcher(tmp_path, *texts):
+    file_list = []
+    for i, text in enumerate(texts, 1):
+        path = tmp_path / f"f{i}.txt"
+        path.write_text(text, encoding="utf-8")
+        file_list.append(str(path))
+    concordance, _membership = sg2.build_concordance(file_list)
+    return sg2.PhraseSearcher(concordance, file_list), file_list
+
+def test_near_same_word_does_not_match_itself(tmp_path):
+    searcher, file_list = make_searcher(tmp_path, "the fox ran far away\n")
+    for query in ("fox NEAR/3 fox", "fox NEAR/0 fox"):
+        counts, positions = searcher.search(query)
+        assert positions == []
+        assert counts == {file_list[0]: 0}
+
+def test_near_same_word_matches_other_occurrences(tmp_path):
+    searcher, _file_list = make_searcher(tmp_path, "the fox ran far\naway fox\n")
+    assert searcher.search("fox NEAR/4 fox")[1] == ["1.1.2"]
+    assert searcher.search("fox NEAR/3 fox")[1] == []
+
+
+# Query server
+
+def test_query_server_rejects_negative_and_boolean_counts(tmp_path):
+    path = tmp_path / "f1.txt"
+    path.write_text("the fox ran far away\n", encoding="utf-8")
+    server = sg2.QueryServer([str(path)])
+    server.load()
+    bad_requests = [
+        {"op": "kwic", "word": "fox", "limit": -1},
+        {"op": "kwic", "word": "fox", "limit": True},
+        {"op": "kwic", "word": "fox", "context": False},
+        {"op": "extra", "n": True},
+    ]
+    for request in bad_requests:
+        with pytest.raises(ValueError):
+            server.query(request)
+    assert len(server.query({"op": "kwic", "word": "fox", "limit": 0})["hits"]) == 0
+    assert server.query({"op": "kwic", "word": "fox", "limit": 1})["hits"][0][:3] == (1, 1, 2)
+
+def test_query_server_skips_unreadable_files(tmp_path):
+    good = tmp_path / "good.txt"
+    good.write_text("the fox ran far away\n", encoding="utf-8")
+    bad = tmp_path / "bad.txt"
+    bad.write_bytes(b"alpha beta\n" * 100 + b"\xff\n")
+    server = sg2.QueryServer([str(good), str(bad)])
+    file_list, skipped = server.load()
+    assert file_list == [str(good)]
+    assert [name for name, _error in skipped] == [str(bad)]
+    assert server.query({"op": "count", "word": "alpha"})["total"] == 0
+
+
+# Approximate profile
+
+def test_approximate_profile_leaves_out_unreadable_files(tmp_path):
+    good = tmp_path / "good.txt"
+    good.write_text("the fox ran far away\n", encoding="utf-8")
+    bad = tmp_path / "bad.txt"
+    bad.write_bytes(b"alpha beta\n" * 500 + b"\xff\n")
+    skipped = []
+    rows, top, _overall = sg2.approximate_profile([str(bad), str(good)], skipped=skipped)
+    assert [row[:2] for row in rows] == [(str(good), 5)]
+    assert [name for name, _error in skipped] == [str(bad)]
+    assert {word for word, _count, _error in top} == {"the", "fox", "ran", "far", "away"}
+    with pytest.raises(UnicodeDecodeError):
+        sg2.approximate_profile([str(bad)])
+
+
+# Spilled concordance
+
+def test_spilled_concordance_keeps_file_statistics(tmp_path, monkeypatch):
+    rng = random.Random(7)
+    file_list = []
+    for i in range(4):
+        path = tmp_path / f"f{i}.txt"
+        path.write_text(random_text(rng, ASCII_PIECES) * 20, encoding="utf-8")
+        file_list.append(str(path))
+    expected, _membership = sg2.build_concordance(file_list)
+    merges = []
+    original = sg2.SpilledConcordance._merged
+    monkeypatch.setattr(sg2.SpilledConcordance, "_merged",
+                        lambda self, paths: merges.append(paths) or original(self, paths))
+    for workers in (None, 2):
+        spilled, _membership = sg2.build_concordance(file_list, workers=workers, memory_budget=2000)
+        word_data = sg2.word_counts_from_concordance(expected, file_list)
+        assert spilled.file_stats() == [(sum(c.values()), len(c)) for c in word_data.values()]
+        merges.clear()
+        assert sg2.extra_lists(spilled, len(file_list)) == sg2.extra_lists(expected, len(file_list))
+        assert merges == []
+        assert [(w, list(p)) for w, p in spilled.iter_sorted()] == \
+            sorted(expected.items(), key=lambda item: sg2.sort_key(item[0]))
+        spilled.close()
+
+
+# Persistent index and incremental concordance
+# Both are checked against a fresh build_concordance over the same files.
+
+VOCABULARY = ["alpha", "beta", "gamma", "delta", "first-base", "well-known", "zeta"]
+
+def write_words(path, rng, words=40, mtime=None):
+    lines = [" ".join(rng.choices(VOCABULARY, k=rng.randint(0, 8))) for _ in range(words // 4)]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+def make_corpus(tmp_path, count=5, seed=3):
+    rng = random.Random(seed)
+    names = []
+    for i in range(count):
+        path = tmp_path / f"f{i}.txt"
+        write_words(path, rng, mtime=1000)
+        names.append(str(path))
+    return rng, names
+
+#word -> sorted positions with file names in place of file numbers.
+def by_name(concordance, files):
+    return {word: sorted((files[f - 1], ln, wn) for f, ln, wn in concordance[word]) for word in concordance}
+
+def assert_same_as_fresh_build(concordance, file_list):
+    expected, _membership = sg2.build_concordance(file_list)
+    assert sorted(concordance.keys()) == sorted(expected.keys())
+    for word in expected:
+        assert concordance[word] == expected[word]
+
+def test_index_round_trip(tmp_path):
+    _rng, file_list = make_corpus(tmp_path)
+    concordance, _membership = sg2.build_concordance(file_list)
+    fingerprints = [sg2.file_fingerprint(name) for name in file_list]
+    index_path = str(tmp_path / sg2.INDEX_FILE)
+    sg2.save_index(concordance, file_list, fingerprints, index_path)
+    index = sg2.ConcordanceIndex(index_path)
+    try:
+        assert index.file_list == file_list
+        assert index.fingerprints == fingerprints
+        assert list(index) == sorted(concordance.keys(), key=sg2.sort_key)
+        for word in concordance:
+            assert word in index
+            assert index[word] == concordance[word]
+            assert index.count(word) == concordance.count(word)
+        assert "omega" not in index
+        word_data = sg2.word_counts_from_concordance(concordance, file_list)
+        assert index.file_stats() == [(sum(c.values()), len(c)) for c in word_data.values()]
+        assert sg2.search_index(index, "alpha") == {name: word_data[name]["alpha"] for name in file_list}
+    finally:
+        index.close()
+
+def test_load_or_build_matches_fresh_build(tmp_path):
+    rng, names = make_corpus(tmp_path)
+    index_path = str(tmp_path / sg2.INDEX_FILE)
+    steps = [
+        ("first build", names),
+        ("unchanged", names),
+        ("mtime moved", names),
+        ("file modified", names),
+        ("reordered", [names[3], names[0], names[4], names[1], names[2]]),
+        ("removed", [names[0], names[2], names[4]]),
+        ("added back", names[::-1]),
+    ]
+    for workers in (None, 2):
+        for step, file_list in steps:
+            if step == "mtime moved":
+                os.utime(names[1], (2000, 2000))
+            elif step == "file modified":
+                write_words(tmp_path / "f2.txt", rng, words=60, mtime=3000)
+            concordance = sg2.load_or_build_concordance(file_list, index_path, workers=workers)
+            reopened = step in ("unchanged", "mtime moved")
+            assert isinstance(concordance, sg2.ConcordanceIndex) == reopened, step
+            assert_same_as_fresh_build(concordance, file_list)
+            if reopened:
+                concordance.close()
+        os.remove(index_path)
+
+def test_load_or_build_closes_the_old_index_before_replacing_it(tmp_path, monkeypatch):
+    rng, file_list = make_corpus(tmp_path)
+    index_path = str(tmp_path / sg2.INDEX_FILE)
+    sg2.load_or_build_concordance(file_list, index_path)
+    opened = []
+    original_init = sg2.ConcordanceIndex.__init__
+
+    def tracking_init(self, path):
+        original_init(self, path)
+        opened.append(self)
+
+    real_replace = os.replace
+
+    def checked_replace(src, dst):
+        assert all(index._mm.closed for index in opened)
+        real_replace(src, dst)
+
+    monkeypatch.setattr(sg2.ConcordanceIndex, "__init__", tracking_init)
+    monkeypatch.setattr(sg2.os, "replace", checked_replace)
+    os.utime(file_list[0], (2000, 2000))
+    index = sg2.load_or_build_concordance(file_list, index_path)  # refresh the mtimes
+    assert index["alpha"] == sg2.build_concordance(file_list)[0]["alpha"]
+    index.close()
+    write_words(tmp_path / "f1.txt", rng, mtime=3000)
+    sg2.load_or_build_concordance(file_list, index_path)  # rebuild
+    assert len(opened) == 3
+
+def test_incremental_concordance_matches_fresh_build(tmp_path):
+    rng, names = make_corpus(tmp_path, count=6)
+    incremental = sg2.IncrementalConcordance()
+    steps = [
+        names[:4],
+        names[:4],                                 # nothing changed
+        [names[0], names[2], names[3], names[4]],  # one removed, one added
+        None,                                      # a file modified in place
+        names[::-1],                               # reordered, removed one back
+        [names[5]],
+    ]
+    for file_list in steps:
+        if file_list is None:
+            write_words(tmp_path / "f2.txt", rng, words=60, mtime=3000)
+            file_list = incremental.file_list
+        incremental.apply(file_list)
+        expected, _membership = sg2.build_concordance(file_list)
+        assert sorted(incremental.file_list) == sorted(file_list)
+        assert by_name(incremental, incremental.files) == by_name(expected, file_list)
+        word_data = sg2.word_counts_from_concordance(expected, file_list)
+        for word in VOCABULARY:
+            assert incremental.file_counts(word) == {name: word_data[name][word]
+                                                     for name in incremental.file_list if word_data[name][word]}
+        top_rows, in_all, only_one = incremental.extra_lists()
+        expected_top, expected_all, expected_one = sg2.extra_lists(expected, len(file_list))
+        assert (top_rows, in_all) == (expected_top, expected_all)
+        assert [[w, incremental.files[f - 1]] for w, f in only_one] == \
+            [[w, file_list[f - 1]] for w, f in expected_one]